@@ -1,4 +1,13 @@
+import os
+import multiprocessing
 from zope.interface import implementer
+from node.utils import LocationIterator
+from node.ext.uml.indexing import (
+    ADDED,
+    REMOVED,
+    register_index,
+    walk,
+)
 from node.ext.uml.interfaces import (
     ModelIllFormedException,
     IPackage,
@@ -21,15 +30,27 @@ from node.ext.uml.interfaces import (
     IOpaqueAction,
     IPreConstraint,
     IPostConstraint,
-    
+    IStereotype,
+    provides,
+)
+from node.ext.uml.core import (
+    UMLElement,
+    NOKEY,
+    referencegetter,
 )
-from node.ext.uml.core import UMLElement
 
 
 @implementer(IActivityNode)
 class ActivityNode(UMLElement):
 
     def check_model_constraints(self):
+        self.check_node_constraints()
+        self.check_edge_constraints(len(list(self.incoming_edges)),
+                                    len(list(self.outgoing_edges)))
+
+    def check_node_constraints(self):
+        """Check the constraints not depending on edges.
+        """
         super(ActivityNode, self).check_model_constraints()
         try:
             assert self.__parent__ is not None
@@ -39,22 +60,25 @@ class ActivityNode(UMLElement):
                   str(self) +  " " +\
                   "An ActivityNode must have an Activity as parent"
 
+    def check_edge_constraints(self, incoming, outgoing):
+        """Check constraints on the number of incoming and outgoing edges.
+        """
+        pass
+
     @property
     def activity(self):
         return self.__parent__
 
-    # cache this
     @property
     def incoming_edges(self):
-        for obj in self.activity.filtereditervalues(IActivityEdge):
-            if obj.target.uuid == self.uuid:
+        for obj in self.modelindex('incomingedges').get(self.uuid):
+            if obj.activity is self.activity:
                 yield obj
 
-    # cache this
     @property
     def outgoing_edges(self):
-        for obj in self.activity.filtereditervalues(IActivityEdge):
-            if obj.source.uuid == self.uuid:
+        for obj in self.modelindex('outgoingedges').get(self.uuid):
+            if obj.activity is self.activity:
                 yield obj
 
 
@@ -99,10 +123,10 @@ class ControlNode(ActivityNode):
 @implementer(IFinalNode)
 class FinalNode(ControlNode):
 
-    def check_model_constraints(self):
-        super(FinalNode, self).check_model_constraints()
+    def check_edge_constraints(self, incoming, outgoing):
+        super(FinalNode, self).check_edge_constraints(incoming, outgoing)
         try:
-            assert list(super(FinalNode, self).outgoing_edges) == []
+            assert outgoing == 0
         except AssertionError:
             raise ModelIllFormedException,\
                   str(self) +  " " +\
@@ -133,16 +157,16 @@ class Activity(Behavior):
 
     @property
     def nodes(self):
-        return self.filtereditervalues(IActivityNode)
+        return self.bucket(IActivityNode)
 
     @property
     def edges(self):
-        return self.filtereditervalues(IActivityEdge)
+        return self.bucket(IActivityEdge)
 
     # Convinience method, not defined by UML 2.2 specification
     @property
     def actions(self):
-        return self.filtereditervalues(IAction)
+        return self.bucket(IAction)
 
 
 @implementer(IOpaqueAction)
@@ -157,14 +181,15 @@ class ActivityEdge(UMLElement):
     def check_model_constraints(self):
         super(ActivityEdge, self).check_model_constraints()
         try:
-            assert self.source or self.target is not None
+            assert self.source is not None and self.target is not None
         except AssertionError:
             raise ModelIllFormedException,\
                   str(self) +  " " +\
                   "An ActivityEdge must have source and target set"
         # [1]
         try:
-            assert self.source.activity is self.target.activity
+            assert getattr(self.source, 'activity', None) \
+                is getattr(self.target, 'activity', None)
         except AssertionError:
             raise ModelIllFormedException,\
                   str(self) +  " " +\
@@ -192,39 +217,45 @@ class ActivityEdge(UMLElement):
 
     source_uuid = None
     target_uuid = None
+    _sourcekey = NOKEY
+    _targetkey = NOKEY
+    guard = None
 
     def __init__(self, name=None, source=None, target=None, guard=None):
+        super(ActivityEdge, self).__init__(name)
         # TODO: bool(source) evals to False if IControlNode.providedBy(source)
-        if IActivityNode.providedBy(source):
+        if provides(source, IActivityNode):
             self.source = source
-        if IActivityNode.providedBy(target):
+        if provides(target, IActivityNode):
             self.target = target
-        self.guard = guard
-        super(ActivityEdge, self).__init__(name)
+        if guard is not None:
+            self.guard = guard
 
     @property
     def activity(self):
         return self.__parent__
 
-    def get_source(self):
-        return self.node(self.source_uuid)
+    get_source = referencegetter('source_uuid', '_sourcekey')
 
     def set_source(self, source):
-        # TODO: invalidate cache key for target's outgoingEdges method
         self.source_uuid = source.uuid
+        self.changed('source')
 
     source = property(get_source, set_source)
 
-    def get_target(self):
-        return self.node(self.target_uuid)
+    get_target = referencegetter('target_uuid', '_targetkey')
 
     def set_target(self, target):
-        # TODO: invalidate cache key for target's incomingEdges method
         self.target_uuid = target.uuid
+        self.changed('target')
 
     target = property(get_target, set_target)
 
 
+register_index('incomingedges', IActivityEdge, lambda edge: [edge.target_uuid])
+register_index('outgoingedges', IActivityEdge, lambda edge: [edge.source_uuid])
+
+
 ##############################################################################
 # Initial and final
 ##############################################################################
@@ -234,11 +265,11 @@ class ActivityEdge(UMLElement):
 class InitialNode(ControlNode):
     abstract = False
 
-    def check_model_constraints(self):
-        super(InitialNode, self).check_model_constraints()
+    def check_edge_constraints(self, incoming, outgoing):
+        super(InitialNode, self).check_edge_constraints(incoming, outgoing)
         # [1]
         try:
-            assert list(super(InitialNode, self).incoming_edges) == []
+            assert incoming == 0
         except AssertionError:
             raise ModelIllFormedException,\
                   str(self) +  " " +\
@@ -264,12 +295,12 @@ class FlowFinalNode(FinalNode):
 class DecisionNode(ControlNode):
     abstract = False
 
-    def check_model_constraints(self):
-        super(DecisionNode, self).check_model_constraints()
+    def check_edge_constraints(self, incoming, outgoing):
+        super(DecisionNode, self).check_edge_constraints(incoming, outgoing)
         # [1]
         try:
-            assert len(list(self.incoming_edges)) is 1
-            assert len(list(self.outgoing_edges)) >= 1
+            assert incoming == 1
+            assert outgoing >= 1
         except AssertionError:
             raise ModelIllFormedException,\
                   str(self) +  " " +\
@@ -281,12 +312,12 @@ class DecisionNode(ControlNode):
 class ForkNode(ControlNode):
     abstract = False
 
-    def check_model_constraints(self):
-        super(ForkNode, self).check_model_constraints()
+    def check_edge_constraints(self, incoming, outgoing):
+        super(ForkNode, self).check_edge_constraints(incoming, outgoing)
         # [1]
         try:
-            assert len(list(self.incoming_edges)) is 1
-            assert len(list(self.outgoing_edges)) >= 1
+            assert incoming == 1
+            assert outgoing >= 1
         except AssertionError:
             raise ModelIllFormedException,\
                   str(self) +  " " +\
@@ -298,12 +329,12 @@ class ForkNode(ControlNode):
 class JoinNode(ControlNode):
     abstract = False
 
-    def check_model_constraints(self):
-        super(JoinNode, self).check_model_constraints()
+    def check_edge_constraints(self, incoming, outgoing):
+        super(JoinNode, self).check_edge_constraints(incoming, outgoing)
         # [1]
         try:
-            assert len(list(self.incoming_edges)) >= 1
-            assert len(list(self.outgoing_edges)) is 1
+            assert incoming >= 1
+            assert outgoing == 1
         except AssertionError:
             raise ModelIllFormedException,\
                   str(self) +  " " +\
@@ -318,12 +349,12 @@ class JoinNode(ControlNode):
 class MergeNode(ControlNode):
     abstract = False
 
-    def check_model_constraints(self):
-        super(MergeNode, self).check_model_constraints()
+    def check_edge_constraints(self, incoming, outgoing):
+        super(MergeNode, self).check_edge_constraints(incoming, outgoing)
         # [1]
         try:
-            assert len(list(self.incoming_edges)) >= 1
-            assert len(list(self.outgoing_edges)) is 1
+            assert incoming >= 1
+            assert outgoing == 1
         except AssertionError:
             raise ModelIllFormedException,\
                   str(self) +  " " +\
@@ -359,17 +390,345 @@ class PostConstraint(Constraint):
     abstract = False
 
 
-def validate(node):
-    """Recursive model validation
+def edge_degrees(activity):
+    """Count incoming and outgoing edges of all nodes in activity in one sweep
+    over its edges.
+
+    ``return``
+      dict mapping node uuid to ``[incoming, outgoing]``.
+    """
+    degrees = dict()
+    for edge in activity.filtereditervalues(IActivityEdge):
+        if edge.target_uuid is not None:
+            degrees.setdefault(edge.target_uuid, [0, 0])[0] += 1
+        if edge.source_uuid is not None:
+            degrees.setdefault(edge.source_uuid, [0, 0])[1] += 1
+    return degrees
+
+
+def check_constraints(node, degrees=None):
+    """Call ``check_model_constraints`` of node.
+
+    ``degrees``
+      dict as returned by ``edge_degrees``. If given, activity nodes are
+      checked by ``check_node_constraints`` and ``check_edge_constraints``
+      with the edge counts taken from it, unless they override
+      ``check_model_constraints``.
     """
-    if IUMLElement.providedBy(node):
+    if degrees is not None and provides(node, IActivityNode) \
+      and type(node).check_model_constraints.im_func \
+      is ActivityNode.check_model_constraints.im_func:
+        incoming, outgoing = degrees.get(node.uuid, (0, 0))
+        node.check_node_constraints()
+        node.check_edge_constraints(incoming, outgoing)
+    else:
         node.check_model_constraints()
+
+
+def validate(node, sweep=False, _degrees=None):
+    """Recursive model validation
+
+    With ``sweep`` the edges of each activity are counted once by
+    ``edge_degrees`` instead of looking up edges per activity node.
+    """
+    if provides(node, IUMLElement):
+        check_constraints(node, _degrees)
+    degrees = None
+    if sweep and provides(node, IActivity):
+        degrees = edge_degrees(node)
     for sub in node.filtereditervalues(IUMLElement):
-        validate(sub)
+        validate(sub, sweep, degrees)
+
+
+def _validation_units(node, position=(), path=()):
+    """Split node into independently validatable units.
+
+    Each activity and each package without its contained packages and
+    activities is a unit. Yields ``(position, path)``, where position lists the
+    child indices and path the keys leading from node to the unit.
+    """
+    yield position, path
+    if not provides(node, IPackage):
+        return
+    for index, child in enumerate(node.values()):
+        if provides(child, IPackage) or provides(child, IActivity):
+            for unit in _validation_units(child,
+                                          position + (index,),
+                                          path + (child.__name__,)):
+                yield unit
+
+
+def _validate_unit(context, unit):
+    """Validate unit of context, returning ``(position, path, exception)`` for
+    each violation.
+    """
+    position, path = unit
+    node = context
+    for key in path:
+        node = node[key]
+    unitroot = node
+    result = list()
+    stack = [(node, position, path, None)]
+    while stack:
+        node, position, path, degrees = stack.pop()
+        if provides(node, IUMLElement):
+            try:
+                check_constraints(node, degrees)
+            except ModelIllFormedException, e:
+                result.append((position, path, e))
+        degrees = None
+        if provides(node, IActivity):
+            degrees = edge_degrees(node)
+        children = list()
+        for index, child in enumerate(node.values()):
+            if not provides(child, IUMLElement):
+                continue
+            if node is unitroot and provides(node, IPackage) \
+              and (provides(child, IPackage) or provides(child, IActivity)):
+                # unit of its own
+                continue
+            children.append((child,
+                             position + (index,),
+                             path + (child.__name__,),
+                             degrees))
+        children.reverse()
+        stack.extend(children)
+    return result
+
+
+# model validated by the worker processes, inherited when forking
+_POOLCONTEXT = None
+
+
+def _validate_pooled(unit):
+    return _validate_unit(_POOLCONTEXT, unit)
+
+
+def _forking():
+    """Whether worker processes are forked and see ``_POOLCONTEXT``.
+    """
+    method = getattr(multiprocessing, 'get_start_method', None)
+    if method is not None:
+        return method() == 'fork'
+    return hasattr(os, 'fork')
+
+
+def validate_all(node, processes=None):
+    """Validate node and everything below, collecting all violations instead
+    of raising on the first one.
+
+    ``processes``
+      Number of worker processes the packages and activities of the model are
+      validated in. ``0`` uses one process per CPU, ``None`` validates in
+      this process. Workers are forked and work on a copy of the model, on
+      platforms not forking processes the model is validated in this process.
+
+    ``return``
+      List of ``(element, ModelIllFormedException)`` in model order, the same
+      for all values of ``processes``.
+    """
+    global _POOLCONTEXT
+    units = list(_validation_units(node))
+    if processes is None or len(units) == 1 or not _forking():
+        results = [_validate_unit(node, unit) for unit in units]
+    else:
+        _POOLCONTEXT = node
+        try:
+            pool = multiprocessing.Pool(processes or None)
+            try:
+                chunksize = max(1, len(units) // ((processes or
+                                multiprocessing.cpu_count()) * 4))
+                results = pool.map(_validate_pooled, units, chunksize)
+            finally:
+                pool.close()
+                pool.join()
+        finally:
+            _POOLCONTEXT = None
+    violations = list()
+    for result in results:
+        violations += result
+    violations.sort(key=lambda violation: violation[0])
+    ret = list()
+    for position, path, exc in violations:
+        element = node
+        for key in path:
+            element = element[key]
+        ret.append((element, exc))
+    return ret
+
+
+def constraint_references(element):
+    """uuids of the elements the constraints of element depend on, apart from
+    its parent and children.
+    """
+    if provides(element, IActivityEdge):
+        return [element.source_uuid, element.target_uuid]
+    if provides(element, IStereotype):
+        return [element._profile]
+    return []
+
+
+class IncrementalValidator(object):
+    """Validates node and everything below once, afterwards only the elements
+    changed since the last run and the elements related by their
+    constraints, i.e. the source and target of a changed ActivityEdge.
+
+    Changes are tracked by subscribing to the model, which gets lost if node
+    is added to another model.
+    """
+
+    def __init__(self, node):
+        self.context = node
+        self._errors = dict()
+        self._references = dict()
+        self._referrers = dict()
+        self._dirty = None
+        node.subscribe(self._changed)
+
+    def close(self):
+        """Stop tracking changes.
+        """
+        self.context.unsubscribe(self._changed)
+
+    def _changed(self, change):
+        if self._dirty is None:
+            return
+        if change.kind in (ADDED, REMOVED):
+            for node in walk(change.node):
+                self._dirty[node.uuid] = node
+        else:
+            self._dirty[change.node.uuid] = change.node
+
+    def validate(self):
+        """Raise the first ``ModelIllFormedException`` in model order, as
+        ``validate(node)`` does.
+        """
+        errors = self.errors
+        if errors:
+            raise errors[0][1]
+
+    @property
+    def errors(self):
+        """List of ``(element, exception)`` for all invalid elements in model
+        order.
+        """
+        try:
+            if self._dirty is None:
+                self._dirty = dict()
+                self._full()
+            elif self._dirty:
+                dirty, self._dirty = self._dirty, dict()
+                self._partial(dirty)
+        except Exception:
+            # state is undefined, start over next time
+            self._dirty = None
+            raise
+        # positions of the children of each parent, built once per call
+        positions = dict()
+        errors = [(self._position(element, positions), element, exc)
+                  for element, exc in self._errors.values()]
+        errors.sort(key=lambda error: error[0])
+        return [(element, exc) for position, element, exc in errors]
+
+    def _contains(self, element):
+        if self.context.root.node(element.uuid) is not element:
+            return False
+        while element is not self.context:
+            if element is None or not provides(element, IUMLElement):
+                return False
+            element = element.__parent__
+        return True
+
+    def _position(self, element, positions):
+        position = list()
+        while element is not self.context:
+            parent = element.__parent__
+            children = positions.get(id(parent))
+            if children is None:
+                children = positions[id(parent)] = dict(
+                    [(key, index) for index, key in enumerate(parent.keys())])
+            position.append(children[element.__name__])
+            element = parent
+        position.reverse()
+        return position
+
+    def _full(self):
+        self._errors = dict()
+        self._references = dict()
+        self._referrers = dict()
+        stack = [(self.context, None)]
+        while stack:
+            node, degrees = stack.pop()
+            if provides(node, IUMLElement):
+                self._check(node, degrees)
+            if provides(node, IActivity):
+                degrees = edge_degrees(node)
+            children = [(sub, degrees)
+                        for sub in node.filtereditervalues(IUMLElement)]
+            children.reverse()
+            stack.extend(children)
+
+    def _partial(self, dirty):
+        # uuid -> element to check, None if it has to be looked up
+        check = dict()
+        for uuid, element in dirty.items():
+            check[uuid] = element
+            for reference in self._references.get(uuid, ()):
+                check.setdefault(reference, None)
+            check.update(self._referrers.get(uuid, ()))
+            if self._contains(element):
+                for reference in constraint_references(element):
+                    check.setdefault(reference, None)
+        root = self.context.root
+        for uuid, element in check.items():
+            if uuid is None:
+                continue
+            # removed elements are forgotten as well
+            self._forget(uuid)
+            if element is None:
+                element = root.node(uuid)
+            if element is not None and self._contains(element):
+                self._check(element)
+
+    def _forget(self, uuid):
+        self._errors.pop(uuid, None)
+        for reference in self._references.pop(uuid, ()):
+            referrers = self._referrers.get(reference)
+            if referrers is None:
+                continue
+            referrers.pop(uuid, None)
+            if not referrers:
+                del self._referrers[reference]
+
+    def _check(self, element, degrees=None):
+        uuid = element.uuid
+        references = list()
+        for reference in constraint_references(element):
+            if reference is not None and reference not in references:
+                references.append(reference)
+        if references:
+            self._references[uuid] = references
+            for reference in references:
+                self._referrers.setdefault(reference, dict())[uuid] = element
+        try:
+            check_constraints(element, degrees)
+        except ModelIllFormedException, e:
+            self._errors[uuid] = (element, e)
 
 
 def get_element_by_xmiid(node, xmiid):
-    if node.xmiid == xmiid:
+    """Find element by xmiid in node and below.
+
+    UML elements use the model wide xmiid index, other nodes are scanned
+    recursively.
+    """
+    if provides(node, IUMLElement):
+        for element in node.modelindex('xmiids').get(xmiid):
+            for parent in LocationIterator(element):
+                if parent is node:
+                    return element
+        return None
+    if getattr(node, 'xmiid', None) == xmiid:
         return node
     # TODO: may not get all elements if an INode but not IUMLElement providing
     # element sits within the hierachy
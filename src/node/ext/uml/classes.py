@@ -2,7 +2,11 @@ from zope.interface import implementer
 from node.ext.uml.core import (
     UMLElement,
     NODEFAULTMARKER,
+    NOKEY,
+    REFERENCEKEYS,
+    referencegetter,
 )
+from node.ext.uml.indexing import register_index
 from node.ext.uml.interfaces import (
     IClass,
     IInterface,
@@ -24,7 +28,7 @@ class Class(UMLElement):
 
     @property
     def operations(self):
-        return self.filtereditervalues(IOperation)
+        return self.bucket(IOperation)
 
 
 @implementer(IInterface)
@@ -32,32 +36,25 @@ class Interface(UMLElement):
 
     @property
     def operations(self):
-        return self.filtereditervalues(IOperation)
+        return self.bucket(IOperation)
 
 
 class _TypedElement(UMLElement):
+    _type = None
+    _typekey = NOKEY
 
-    def __init__(self, name=None):
-        super(_TypedElement, self).__init__(name)
-        self._type = None
-
-    def _gettype(self):
-        if self._type is not None:
-            return  self.node(self._type)
-        return None
+    _gettype = referencegetter('_type', '_typekey')
 
     def _settype(self, typeinstance):
         self._type = typeinstance.uuid
+        self.changed('type')
 
     type = property(_gettype, _settype)
 
 
 @implementer(IProperty)
 class Property(_TypedElement):
-
-    def __init__(self, name=None):
-        super(Property, self).__init__(name)
-        self.default = NODEFAULTMARKER
+    default = NODEFAULTMARKER
 
 
 @implementer(IOperation)
@@ -70,11 +67,8 @@ class Operation(UMLElement):
 
 @implementer(IParameter)
 class Parameter(_TypedElement):
-
-    def __init__(self, name=None):
-        super(Parameter, self).__init__(name)
-        self.default = NODEFAULTMARKER
-        self.direction = 'in'
+    default = NODEFAULTMARKER
+    direction = 'in'
 
 
 ###############################################################################
@@ -84,28 +78,29 @@ class Parameter(_TypedElement):
 
 @implementer(IGeneralization)
 class Generalization(UMLElement):
-
-    def __init__(self, name=None):
-        super(Generalization, self).__init__(name)
-        self._general = None
+    _general = None
+    _generalkey = NOKEY
 
     @property
     def specific(self):
         return self.__parent__
 
-    def _getgeneral(self):
-        if self._general is not None:
-            return  self.node(self._general)
-        return None
+    _getgeneral = referencegetter('_general', '_generalkey')
 
     def _setgeneral(self, instance):
         self._general = instance.uuid
+        self.changed('general')
 
     general = property(_getgeneral, _setgeneral)
 
 
+register_index('generalizations', IGeneralization,
+               lambda generalization: [generalization._general])
+
+
 @implementer(IInterfaceRealization)
 class InterfaceRealization(UMLElement):
+    _contractkey = NOKEY
 
     def __init__(self, name=None):
         super(InterfaceRealization, self).__init__(name)
@@ -115,30 +110,42 @@ class InterfaceRealization(UMLElement):
     def implementingClassifier(self):
         return self.__parent__
 
-    def _getcontract(self):
-        if self._contract is not None:
-            return  self.node(self._contract)
-        return None
+    _getcontract = referencegetter('_contract', '_contractkey')
 
     def _setcontract(self, instance):
         self._contract = instance.uuid
+        self.changed('contract')
 
     contract = property(_getcontract, _setcontract)
 
 
+register_index('interfacerealizations', IInterfaceRealization,
+               lambda realization: [realization._contract])
+
+
+REFERENCEKEYS.add('_memberEndskeys')
+
+
 @implementer(IAssociation)
 class Association(UMLElement):
+    _memberEndskeys = (None, ())
 
     def __init__(self, name=None):
         super(Association, self).__init__(name)
         self._memberEnds = list()
 
-    # XXX: looks like storing a reference directly would do the job
     def _getmemberEnds(self):
-        return [self.node(uuid) for uuid in self._memberEnds]
+        uuids = self._memberEnds
+        keys = self._memberEndskeys
+        if keys[0] is not uuids or len(keys[1]) != len(uuids):
+            keys = self._memberEndskeys = \
+                (uuids, [int(uuid) for uuid in uuids])
+        get = self._index.get
+        return [get(key) for key in keys[1]]
 
     def _setmemberEnds(self, instances):
         self._memberEnds = [i.uuid for i in instances]
+        self.changed('memberEnds')
 
     memberEnds = property(_getmemberEnds, _setmemberEnds)
 
@@ -160,61 +167,64 @@ class AssociationEnd(UMLElement):
     SHARED = 'shared'
     COMPOSITE = 'composite'
     AGGREGATIONS = [SHARED, COMPOSITE]
+    _type = None
+    _typekey = NOKEY
+    _association = None
+    _associationkey = NOKEY
+    lowervalue = None
+    uppervalue = None
+    aggregationkind = None
+    navigable = False
 
-    def __init__(self, name=None):
-        super(AssociationEnd, self).__init__(name)
-        self._type = None
-        self._association = None
-        self.lowervalue = None
-        self.uppervalue = None
-        self.aggregationkind = None
-        self.navigable = False
-
-    def _gettype(self):
-        if self._type is not None:
-            return self.node(self._type)
-        return None
+    _gettype = referencegetter('_type', '_typekey')
 
     def _settype(self, instance):
         self._type = instance.uuid
+        self.changed('type')
 
     type = property(_gettype, _settype)
 
-    def _getassociation(self):
-        if self._association is not None:
-            return self.node(self._association)
-        return None
+    _getassociation = referencegetter('_association', '_associationkey')
 
     def _setassociation(self, instance):
         self._association = instance.uuid
+        self.changed('association')
 
     association = property(_getassociation, _setassociation)
 
 
+register_index('associationends', IAssociationEnd,
+               lambda end: [end._type])
+
+
 @implementer(IDependency)
 class Dependency(UMLElement):
+    _clientkey = NOKEY
+    _supplierkey = NOKEY
 
     def __init__(self, name=None):
         super(Dependency, self).__init__(name)
         self._client = None
         self._supplier = None
 
-    def _getclient(self):
-        if self._client is not None:
-            return  self.node(self._client)
-        return None
+    _getclient = referencegetter('_client', '_clientkey')
 
     def _setclient(self, instance):
         self._client = instance.uuid
+        self.changed('client')
 
     client = property(_getclient, _setclient)
 
-    def _getsupplier(self):
-        if self._supplier is not None:
-            return  self.node(self._supplier)
-        return None
+    _getsupplier = referencegetter('_supplier', '_supplierkey')
 
     def _setsupplier(self, instance):
         self._supplier = instance.uuid
+        self.changed('supplier')
 
     supplier = property(_getsupplier, _setsupplier)
+
+
+register_index('clientdependencies', IDependency,
+               lambda dependency: [dependency._client])
+register_index('supplierdependencies', IDependency,
+               lambda dependency: [dependency._supplier])
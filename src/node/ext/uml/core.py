@@ -1,4 +1,5 @@
 import logging
+from odict import odict
 from plumber import plumber
 from zope.interface import implementer
 from node.base import OrderedNode
@@ -10,6 +11,12 @@ from node.behaviors import (
     Reference,
     Order,
 )
+from node.ext.uml.indexing import (
+    Indexing,
+    Buckets,
+    register_index,
+    modelindexes,
+)
 from node.ext.uml.interfaces import (
     ModelIllFormedException,
     IUMLElement,
@@ -22,6 +29,7 @@ from node.ext.uml.interfaces import (
     IPackage,
     IModel,
     IActivity,
+    provides,
 )
 
 
@@ -31,21 +39,122 @@ log = logging.getLogger('node.ext.uml')
 NODEFAULTMARKER = object()
 INFINITE = object()
 
+# storage of all elements without children, never written to
+_NOCHILDREN = odict()
+
+# References to other elements are stored as uuid. The key of the uuid in the
+# uuid index of the model is cached along with the uuid it was computed from,
+# so dereferencing is a lookup in the index. This is the initial cache.
+NOKEY = (None, None)
+
+# names of the attributes caching index keys of references
+REFERENCEKEYS = set()
+
+
+def referencegetter(uuidattr, keyattr):
+    """Return a getter resolving the uuid stored in attribute ``uuidattr``,
+    caching its index key in attribute ``keyattr``, see ``NOKEY``.
+    """
+    REFERENCEKEYS.add(keyattr)
+
+    def get(self):
+        uuid = getattr(self, uuidattr)
+        if uuid is None:
+            return None
+        key = getattr(self, keyattr)
+        if key[0] is not uuid:
+            key = (uuid, int(uuid))
+            setattr(self, keyattr, key)
+        return self._index.get(key[1])
+    return get
+
 
 @implementer(IUMLElement, ICallable)
 class UMLElement(OrderedNode):
     __metaclass__ = plumber
-    __plumbing__ = Reference, Order
+    __plumbing__ = Reference, Order, Indexing, Buckets
     abstract = True
-    xmiid = None
     XMI = None
     xminame=None
+    _xmiid = None
 
     def __call__(self):
         """Does nothing but fullfill contract.
         """
         pass
 
+    # Most elements never get children, they share an empty storage until
+    # the first child is added. Attributes which usually keep their initial
+    # value are class attributes for the same reason.
+
+    @property
+    def storage(self):
+        return self.__dict__.get('_storage', _NOCHILDREN)
+
+    def __setitem__(self, key, val):
+        if '_storage' not in self.__dict__:
+            self._storage = odict()
+        super(UMLElement, self).__setitem__(key, val)
+
+    def bulk_add(self, items):
+        """Add many children at once.
+
+        ``items`` is a mapping or an iterable of ``(name, element)`` pairs.
+        Children are stored and registered in the uuid index one after the
+        other, the model indexes get updated and subscribers notified once
+        all of them are stored. Children replacing an existing one are set
+        the regular way.
+
+        The result is the same as setting the children one by one.
+        """
+        if hasattr(items, 'items'):
+            items = items.items()
+        if '_storage' not in self.__dict__:
+            self._storage = odict()
+        storage = self._storage
+        index = self._index
+        added = list()
+        try:
+            for key, val in items:
+                if not isinstance(val, UMLElement):
+                    raise ValueError(u"Only UML elements can be added at once")
+                if dict.__contains__(storage, key):
+                    self._bulk_added(added)
+                    added = list()
+                    self[key] = val
+                    continue
+                subindex = val._index
+                for iuuid in subindex:
+                    if dict.__contains__(index, iuuid):
+                        raise ValueError(u"Node with uuid already exists")
+                index.update(subindex)
+                val._index = index
+                if val.__dict__.get('_modelindexes') is not None:
+                    val._modelindexes = None
+                val.__name__ = key
+                val.__parent__ = self
+                storage[key] = val
+                if self._buckets:
+                    self._bucketadd(key, val)
+                added.append(val)
+        finally:
+            self._bulk_added(added)
+
+    def _bulk_added(self, added):
+        indexes = modelindexes(self)
+        if indexes is not None:
+            for val in added:
+                indexes.add(val)
+
+    def _getxmiid(self):
+        return self._xmiid
+
+    def _setxmiid(self, xmiid):
+        self._xmiid = xmiid
+        self.changed('xmiid')
+
+    xmiid = property(_getxmiid, _setxmiid)
+
     @property
     def name(self):
         return self.__name__
@@ -62,14 +171,25 @@ class UMLElement(OrderedNode):
 
     @property
     def stereotypes(self):
-        return self.filtereditervalues(IStereotype)
+        return self.bucket(IStereotype)
 
     def stereotype(self, stereotypename):
-        for stereotype in self.stereotypes:
-            if stereotype.name == stereotypename:
-                return stereotype
+        # stereotypes are keyed by their name
+        stereotype = self.get(stereotypename)
+        if provides(stereotype, IStereotype):
+            return stereotype
         return None
 
+    def has_stereotype(self, stereotypename=None):
+        """Check if stereotype with given name is applied, or if any
+        stereotype is applied if no name is given.
+        """
+        if stereotypename is not None:
+            return self.stereotype(stereotypename) is not None
+        for stereotype in self.stereotypes:
+            return True
+        return False
+
     def check_model_constraints(self):
         try:
             assert(not self.abstract)
@@ -79,6 +199,9 @@ class UMLElement(OrderedNode):
                   "Cannot directly use abstract base classes"
 
 
+register_index('xmiids', IUMLElement, lambda element: [element._xmiid])
+
+
 @implementer(IProfile)
 class Profile(UMLElement):
     abstract = False
@@ -105,18 +228,17 @@ class Profile(UMLElement):
 @implementer(IStereotype)
 class Stereotype(UMLElement):
     abstract = False
+    _profilekey = NOKEY
 
     def __init__(self, name=None):
         super(Stereotype, self).__init__(name)
         self._profile = None
 
-    def _getprofile(self):
-        if self._profile is not None:
-            return  self.node(self._profile)
-        return None
+    _getprofile = referencegetter('_profile', '_profilekey')
 
     def _setprofile(self, profileinstance):
         self._profile = profileinstance.uuid
+        self.changed('profile')
 
     profile = property(_getprofile, _setprofile)
 
@@ -125,9 +247,10 @@ class Stereotype(UMLElement):
         return self.filtereditervalues(ITaggedValue)
 
     def taggedvalue(self, taggedvaluename):
-        for tgv in self.taggedvalues:
-            if tgv.name == taggedvaluename:
-                return tgv
+        # tagged values are keyed by their name
+        tgv = self.get(taggedvaluename)
+        if provides(tgv, ITaggedValue):
+            return tgv
         return None
 
     def check_model_constraints(self):
@@ -139,10 +262,23 @@ class Stereotype(UMLElement):
                   u"Stereotype must have a reference to its Profile"
 
 
+register_index('stereotypeapplications', IStereotype,
+               lambda stereotype: [(stereotype._profile, stereotype.__name__)])
+
+
 @implementer(ITaggedValue)
 class TaggedValue(UMLElement):
     abstract = False
-    value = None
+    _value = None
+
+    def _getvalue(self):
+        return self._value
+
+    def _setvalue(self, value):
+        self._value = value
+        self.changed('value')
+
+    value = property(_getvalue, _setvalue)
 
 
 @implementer(IDatatype)
@@ -156,23 +292,23 @@ class Package(UMLElement):
 
     @property
     def packages(self):
-        return self.filtereditervalues(IPackage)
+        return self.bucket(IPackage)
 
     @property
     def classes(self):
-       return self.filtereditervalues(IClass)
+        return self.bucket(IClass)
 
     @property
     def interfaces(self):
-        return self.filtereditervalues(IInterface)
+        return self.bucket(IInterface)
 
     @property
     def profiles(self):
-        return self.filtereditervalues(IProfile)
+        return self.bucket(IProfile)
 
     @property
     def activities(self):
-        return self.filtereditervalues(IActivity)
+        return self.bucket(IActivity)
 
 
 @implementer(IModel, IRoot)
@@ -181,4 +317,4 @@ class Model(Package):
 
     @property
     def datatypes(self):
-        return self.filtereditervalues(IDatatype)
+        return self.bucket(IDatatype)
@@ -0,0 +1,474 @@
+from odict import odict
+from plumber import (
+    Behavior,
+    default,
+    plumb,
+)
+from node.interfaces import INode
+from node.ext.uml.interfaces import provides
+
+
+INDEXES = dict()
+CACHES = dict()
+
+
+def register_index(name, interface, keys, factory=None):
+    """Register a model wide reverse index.
+
+    ``name``
+      Name the index is looked up by.
+
+    ``interface``
+      Only elements providing this interface are indexed.
+
+    ``keys``
+      Callable taking an element and returning the keys it is indexed under.
+      ``None`` keys are ignored.
+
+    ``factory``
+      Class of the index, called with interface and keys. Defaults to
+      ``ReverseIndex``.
+    """
+    INDEXES[name] = (interface, keys, factory or ReverseIndex)
+
+
+def register_cache(name, interface, factory):
+    """Register a model wide cache.
+
+    ``name``
+      Name the cache is looked up by.
+
+    ``interface``
+      Only changes of elements providing this interface invalidate the cache.
+
+    ``factory``
+      Callable creating the cache. The cache must provide an ``invalidate``
+      method, which gets called with each element added to, removed from or
+      reindexed in the model.
+    """
+    CACHES[name] = (interface, factory)
+
+
+def walk(node):
+    """Iterate over node and all nodes contained in it, depth first.
+    """
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        yield node
+        children = [v for v in node.values() if INode.providedBy(v)]
+        children.reverse()
+        stack.extend(children)
+
+
+class ReverseIndex(object):
+    """Maps keys, usually the uuid of a referenced element, to the elements
+    referring to it.
+    """
+
+    def __init__(self, interface, keys):
+        self.interface = interface
+        self.keys = keys
+        self._entries = dict()
+        self._registered = dict()
+
+    def add(self, node):
+        if not provides(node, self.interface):
+            return
+        keys = tuple([key for key in self.keys(node) if key is not None])
+        self._registered[node.uuid] = keys
+        for key in keys:
+            entries = self._entries.get(key)
+            if entries is None:
+                entries = self._entries[key] = odict()
+            entries[node.uuid] = node
+
+    def remove(self, node):
+        for key in self._registered.pop(node.uuid, ()):
+            entries = self._entries[key]
+            del entries[node.uuid]
+            if not entries:
+                del self._entries[key]
+
+    def update(self, node):
+        self.remove(node)
+        self.add(node)
+
+    def get(self, key):
+        """List of elements indexed under key.
+        """
+        entries = self._entries.get(key)
+        if entries is None:
+            return list()
+        return entries.values()
+
+    def iter(self, key):
+        """Iterate over the elements indexed under key.
+        """
+        entries = self._entries.get(key)
+        if entries is None:
+            return iter(())
+        return entries.itervalues()
+
+    def count(self, key):
+        """Number of elements indexed under key.
+        """
+        entries = self._entries.get(key)
+        if entries is None:
+            return 0
+        return dict.__len__(entries)
+
+
+ADDED = 'added'
+REMOVED = 'removed'
+MODIFIED = 'modified'
+
+
+class ModelChange(object):
+    """Passed to the subscribers of a model on each change.
+
+    ``kind``
+      One of ``ADDED``, ``REMOVED`` or ``MODIFIED``.
+
+    ``node``
+      The added, removed or modified element. For added and removed subtrees
+      only the root of the subtree is passed.
+
+    ``name``
+      Name of the changed reference if kind is ``MODIFIED``.
+
+    ``generation``
+      Generation of the model after the change.
+    """
+
+    def __init__(self, kind, node, name, generation):
+        self.kind = kind
+        self.node = node
+        self.name = name
+        self.generation = generation
+
+    def __repr__(self):
+        return '<ModelChange %s %r%s generation=%s>' % (
+            self.kind, self.node, self.name and ' ' + self.name or '',
+            self.generation)
+
+
+class ModelIndexes(object):
+    """Container for the reverse indexes, caches, modification counter and
+    subscribers of one model.
+
+    Indexes are built on first access by scanning the model once and kept up
+    to date afterwards. Caches get told about changed elements. ``generation``
+    is incremented on each change.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.generation = 0
+        self._indexes = dict()
+        self._caches = dict()
+        self._subscribers = list()
+
+    def subscribe(self, subscriber):
+        """Call subscriber with a ``ModelChange`` on each change of the model.
+        """
+        self._subscribers.append(subscriber)
+
+    def unsubscribe(self, subscriber):
+        self._subscribers.remove(subscriber)
+
+    def _notify(self, kind, node, name=None):
+        self.generation += 1
+        if self._subscribers:
+            change = ModelChange(kind, node, name, self.generation)
+            for subscriber in list(self._subscribers):
+                subscriber(change)
+
+    def __getitem__(self, name):
+        index = self._indexes.get(name)
+        if index is None:
+            interface, keys, factory = INDEXES[name]
+            index = factory(interface, keys)
+            for node in walk(self.root):
+                index.add(node)
+            self._indexes[name] = index
+        return index
+
+    def cache(self, name):
+        cache = self._caches.get(name)
+        if cache is None:
+            cache = self._caches[name] = CACHES[name][1]()
+        return cache
+
+    def _invalidate(self, node):
+        for name, cache in self._caches.items():
+            if provides(node, CACHES[name][0]):
+                cache.invalidate(node)
+
+    def add(self, node):
+        """Index node and all nodes contained in it.
+        """
+        if self._indexes or self._caches:
+            indexes = self._indexes.values()
+            for sub in walk(node):
+                for index in indexes:
+                    index.add(sub)
+                self._invalidate(sub)
+        self._notify(ADDED, node)
+
+    def remove(self, node):
+        """Remove node and all nodes contained in it from indexes.
+        """
+        if self._indexes or self._caches:
+            indexes = self._indexes.values()
+            for sub in walk(node):
+                self._invalidate(sub)
+                for index in indexes:
+                    index.remove(sub)
+        self._notify(REMOVED, node)
+
+    def update(self, node, name=None):
+        """Reindex a single node after its reference ``name`` changed.
+        """
+        for index in self._indexes.values():
+            index.update(node)
+        self._invalidate(node)
+        self._notify(MODIFIED, node, name)
+
+    def reorder(self, node, children):
+        """Invalidate caches after the order of children of node changed.
+        """
+        for child in children:
+            self._invalidate(child)
+        self._invalidate(node)
+        self._notify(MODIFIED, node)
+
+
+class ChildBucket(object):
+    """Children of a node providing an interface, in insertion order.
+
+    The children are collected on first use and kept up to date by the
+    ``Buckets`` behavior of the node afterwards.
+    """
+
+    def __init__(self, node, interface):
+        self.node = node
+        self.interface = interface
+
+    def _entries(self):
+        node = self.node
+        buckets = node._buckets
+        if buckets is not None:
+            entries = buckets.get(self.interface)
+            if entries is not None:
+                return entries
+        keys = node.keys()
+        if not keys:
+            # nothing to keep up to date for nodes without children
+            return _EMPTY
+        entries = node._bucketentries(keys, self.interface)
+        # reading children may have dropped the buckets
+        buckets = node._buckets
+        if buckets is None:
+            buckets = node._buckets = dict()
+        buckets[self.interface] = entries
+        return entries
+
+    def __iter__(self):
+        return self._entries().itervalues()
+
+    def __len__(self):
+        # odict is a dict, its own len iterates over all entries
+        return dict.__len__(self._entries())
+
+    def __nonzero__(self):
+        return bool(len(self))
+
+    def __repr__(self):
+        return '<ChildBucket %s of %r>' % (self.interface.__name__, self.node)
+
+
+# bucket of nodes without children, never written to
+_EMPTY = odict()
+
+
+class Buckets(Behavior):
+    """Keeps children per interface asked for by ``bucket``.
+
+    Buckets are updated on child add and remove and dropped if children are
+    replaced or reordered.
+    """
+    _buckets = default(None)
+
+    @default
+    def bucket(self, interface):
+        """Return the children providing interface as ``ChildBucket``.
+        """
+        return ChildBucket(self, interface)
+
+    @default
+    def _bucketentries(self, keys, interface):
+        """Return the children with keys providing interface as odict.
+        """
+        entries = odict()
+        for key in keys:
+            value = self[key]
+            if provides(value, interface):
+                entries[key] = value
+        return entries
+
+    @default
+    def _bucketadd(self, key, val):
+        for interface, entries in self._buckets.iteritems():
+            if provides(val, interface):
+                entries[key] = val
+
+    @plumb
+    def __setitem__(_next, self, key, val):
+        if self._buckets and dict.__contains__(self.storage, key):
+            # the replacing child may go to other buckets, at the position
+            # of the replaced one
+            self._buckets = None
+        _next(self, key, val)
+        if self._buckets:
+            self._bucketadd(key, val)
+
+    @plumb
+    def __delitem__(_next, self, key):
+        _next(self, key)
+        if self._buckets:
+            for entries in self._buckets.itervalues():
+                if dict.__contains__(entries, key):
+                    del entries[key]
+
+    @plumb
+    def swap(_next, self, node_a, node_b):
+        self._buckets = None
+        _next(self, node_a, node_b)
+
+    @plumb
+    def insertfirst(_next, self, newnode):
+        self._buckets = None
+        _next(self, newnode)
+
+    @plumb
+    def insertlast(_next, self, newnode):
+        self._buckets = None
+        _next(self, newnode)
+
+    @plumb
+    def insertbefore(_next, self, newnode, refnode):
+        self._buckets = None
+        _next(self, newnode, refnode)
+
+    @plumb
+    def insertafter(_next, self, newnode, refnode):
+        self._buckets = None
+        _next(self, newnode, refnode)
+
+
+def container(node):
+    """Return the root of the model node is contained in.
+
+    Deleted and detached nodes keep their parent. Parents no longer
+    containing the node are not followed, such nodes are the root of their
+    own model.
+    """
+    while True:
+        parent = node.__parent__
+        if parent is None:
+            return node
+        storage = getattr(parent, 'storage', None)
+        if storage is not None and storage.get(node.__name__) is not node:
+            return node
+        node = parent
+
+
+def modelindexes(node, create=False):
+    """Return the ``ModelIndexes`` of the model node is contained in.
+
+    If no indexes exist yet for this model ``None`` is returned, unless
+    ``create`` is given.
+    """
+    root = container(node)
+    indexes = getattr(root, '_modelindexes', None)
+    if indexes is None and create:
+        indexes = root._modelindexes = ModelIndexes(root)
+    return indexes
+
+
+class Indexing(Behavior):
+    """Keeps the model wide indexes up to date and notifies subscribers on
+    child add, remove and swap.
+
+    Elements changing a reference are expected to call ``changed``.
+    """
+    _modelindexes = default(None)
+
+    @plumb
+    def __setitem__(_next, self, key, val):
+        indexes = modelindexes(self)
+        if indexes is not None and key in self:
+            indexes.remove(self[key])
+        _next(self, key, val)
+        if not INode.providedBy(val):
+            return
+        # indexes of a formerly standalone subtree are stale from now on
+        if getattr(val, '_modelindexes', None) is not None:
+            val._modelindexes = None
+        if indexes is not None:
+            indexes.add(val)
+
+    @plumb
+    def __delitem__(_next, self, key):
+        indexes = modelindexes(self)
+        if indexes is not None:
+            indexes.remove(self[key])
+        _next(self, key)
+
+    @plumb
+    def swap(_next, self, node_a, node_b):
+        _next(self, node_a, node_b)
+        indexes = modelindexes(self)
+        if indexes is not None:
+            indexes.reorder(self, (node_a, node_b))
+
+    @default
+    def modelindex(self, name):
+        """Return the model wide index registered by name.
+        """
+        return modelindexes(self, create=True)[name]
+
+    @default
+    def modelcache(self, name):
+        """Return the model wide cache registered by name.
+        """
+        return modelindexes(self, create=True).cache(name)
+
+    @default
+    def changed(self, name=None):
+        """Tell the model reference ``name`` of this element changed.
+        """
+        indexes = modelindexes(self)
+        if indexes is not None:
+            indexes.update(self, name)
+
+    @default
+    @property
+    def generation(self):
+        """Modification counter of the model, incremented on each change.
+        """
+        return modelindexes(self, create=True).generation
+
+    @default
+    def subscribe(self, subscriber):
+        """Call subscriber with a ``ModelChange`` on each change of the model.
+
+        Subscribers of a standalone subtree are dropped once it gets added to
+        a model.
+        """
+        modelindexes(self, create=True).subscribe(subscriber)
+
+    @default
+    def unsubscribe(self, subscriber):
+        modelindexes(self, create=True).unsubscribe(subscriber)
@@ -7,6 +7,7 @@ James Rumbaugh, Ivar Jacobson, Grady Booch. Addison-Wesley, 2005
 [3] Unified Modeling Language Specification (version 2.1)
 """
 from zope.interface import Attribute
+from zope.interface.interface import InterfaceClass
 from node.interfaces import (
     INode,
     ILeaf,
@@ -46,6 +47,9 @@ class IUMLElement(INode):
     def stereotype(name):
         """returns stereotype by name."""
 
+    def has_stereotype(name=None):
+        """check if stereotype by name, or any stereotype, is applied."""
+
     def check_model_constraints(self):
         """Since some rules cannot be evaluated at instantiation time this
         function should be called on model elements by the interpreter when
@@ -485,3 +489,54 @@ class IPostConstraint(IConstraint):
     """Marker interface for conditions which must be evaluated at the end of
     an Activity or after an actions was executed.
     """
+
+
+###############################################################################
+# Interface bitmasks
+###############################################################################
+
+
+# bit of each interface of this module
+KINDS = dict([(interface, 1 << bit) for bit, interface in enumerate(sorted(
+    [value for value in globals().values()
+     if isinstance(value, InterfaceClass) and value.__module__ == __name__],
+    key=lambda interface: interface.__name__))])
+
+# element class -> bitmask of the interfaces it implements
+_MASKS = dict()
+_UNKNOWN = object()
+
+
+def kindmask(cls):
+    """Bitmask of the interfaces of this module implemented by class cls,
+    ``None`` if cls does not implement ``IUMLElement``.
+
+    Computed once per class.
+    """
+    mask = _MASKS.get(cls, _UNKNOWN)
+    if mask is _UNKNOWN:
+        mask = None
+        if IUMLElement.implementedBy(cls):
+            mask = 0
+            for interface, bit in KINDS.items():
+                if interface.implementedBy(cls):
+                    mask |= bit
+        _MASKS[cls] = mask
+    return mask
+
+
+def provides(obj, interface):
+    """Whether obj provides interface.
+
+    Looks at the bitmask of the class of UML elements instead of asking
+    ``interface.providedBy``, which is done for other objects, interfaces not
+    defined in this module and elements providing interfaces directly.
+    """
+    mask = _MASKS.get(obj.__class__, _UNKNOWN)
+    if mask is _UNKNOWN:
+        mask = kindmask(obj.__class__)
+    if mask is not None and '__provides__' not in obj.__dict__:
+        bit = KINDS.get(interface)
+        if bit is not None:
+            return mask & bit != 0
+    return interface.providedBy(obj)
@@ -0,0 +1,327 @@
+"""Binary snapshots of whole models.
+
+A snapshot stores a model as flat tables, written in one sweep over the
+model and read back without going through the regular element construction
+and child insertion code::
+
+    header        magic, table sizes
+    uuids         16 bytes per row, rows of elements first, then rows of
+                  referenced uuids not contained in the model
+    elements      int32 columns kind, parent, name, xmiid
+    references    int32 columns element, attribute, uuid row, position
+    attributes    int32 columns element, attribute, value
+    constants     marshalled tuple of kind names, strings and values
+
+Elements are stored depth first, so each parent is stored before its
+children. Names, xmiids and attribute names are indexes into the strings,
+values of attributes are indexes into the values, negative ones stand for
+``core.INFINITE`` and ``core.NODEFAULTMARKER``. All integers are little
+endian, uuids big endian as in ``UUID.bytes``. All tables start at a
+multiple of 4 bytes and are read as a whole, a snapshot given by file name is
+memory mapped instead of read.
+"""
+import gc
+import os
+import sys
+import mmap
+import struct
+import marshal
+from array import array
+from uuid import UUID
+from odict import odict
+from node.ext.uml.core import (
+    UMLElement,
+    REFERENCEKEYS,
+    INFINITE,
+    NODEFAULTMARKER,
+)
+from node.ext.uml.indexing import walk
+
+
+MAGIC = 'UMLSNAP1'
+
+_HEADER = struct.Struct('<8s5I')
+_NONE = -1
+_SCALAR = -1
+_MISSING = object()
+_LOW = (1 << 64) - 1
+
+# values which cannot be marshalled, stored as value -1 - position
+_SENTINELS = (INFINITE, NODEFAULTMARKER)
+
+# instance attributes not stored as attribute
+_STRUCTURE = frozenset([
+    '__name__',
+    '__parent__',
+    '_uuid',
+    '_index',
+    '_storage',
+    '_modelindexes',
+    '_xmiid',
+    '_buckets',
+])
+
+
+def _int32():
+    table = array('i')
+    assert table.itemsize == 4
+    return table
+
+
+def _kind(cls):
+    return '%s.%s' % (cls.__module__, cls.__name__)
+
+
+def _resolve(kind):
+    module, name = kind.rsplit('.', 1)
+    __import__(module)
+    cls = getattr(sys.modules[module], name, None)
+    if not isinstance(cls, type) or not issubclass(cls, UMLElement):
+        raise ValueError(u"Unknown element kind '%s'" % kind)
+    return cls
+
+
+_TEMPLATES = dict()
+
+
+def _template(cls):
+    """Instance attributes of a newly created element of class cls, and the
+    names of the ones which are lists.
+    """
+    template = _TEMPLATES.get(cls)
+    if template is None:
+        prototype = cls()
+        attrs = dict([(key, value) for key, value in
+                      prototype.__dict__.items() if key not in _STRUCTURE])
+        lists = [key for key, value in attrs.items() if isinstance(value, list)]
+        template = _TEMPLATES[cls] = (attrs, lists)
+    return template
+
+
+class _Table(object):
+    """Assign consecutive rows to distinct values.
+    """
+
+    def __init__(self):
+        self.rows = dict()
+        self.values = list()
+
+    def __call__(self, value):
+        if value is None:
+            return _NONE
+        key = (type(value), value)
+        row = self.rows.get(key)
+        if row is None:
+            row = self.rows[key] = len(self.values)
+            self.values.append(value)
+        return row
+
+
+def dump(model, out):
+    """Write a snapshot of model to out, a file name or file object.
+
+    Instance attributes holding a uuid or a list of uuids are stored as
+    references, all other ones differing from the ones of a new element as
+    attribute values, which must be marshallable.
+    """
+    if isinstance(out, basestring):
+        with open(out, 'wb') as fd:
+            return dump(model, fd)
+    _write(walk(model), out)
+
+
+def _write(nodes, out):
+    """Write a snapshot of nodes, an iterable yielding the root first and
+    each parent before its children.
+    """
+    kinds = _Table()
+    strings = _Table()
+    values = list()
+    elements = list()
+    rows = dict()
+    uuids = list()
+    kind, parent, name, xmiid = [_int32() for _ in range(4)]
+    refowner, refname, reftarget, refposition = [_int32() for _ in range(4)]
+    attrowner, attrname, attrvalue = [_int32() for _ in range(3)]
+    for element in nodes:
+        if not isinstance(element, UMLElement):
+            raise ValueError(u"Cannot store %r" % element)
+        row = rows[element._uuid.int] = len(elements)
+        elements.append(element)
+        uuids.append(element._uuid.int)
+        kind.append(kinds(_kind(element.__class__)))
+        if row:
+            parent.append(rows[element.__parent__._uuid.int])
+        else:
+            parent.append(_NONE)
+        name.append(strings(element.__name__))
+        xmiid.append(strings(element._xmiid))
+    for row, element in enumerate(elements):
+        template = _template(element.__class__)[0]
+        for key, value in element.__dict__.items():
+            if key in _STRUCTURE or key in REFERENCEKEYS:
+                continue
+            if isinstance(value, UUID):
+                targets = [(value, _SCALAR)]
+            elif isinstance(value, list) and value \
+              and isinstance(value[0], UUID):
+                targets = [(target, position)
+                           for position, target in enumerate(value)]
+            else:
+                default = template.get(
+                    key, getattr(element.__class__, key, _MISSING))
+                if default is value or default == value:
+                    continue
+                attrowner.append(row)
+                attrname.append(strings(key))
+                for position, sentinel in enumerate(_SENTINELS):
+                    if value is sentinel:
+                        attrvalue.append(-1 - position)
+                        break
+                else:
+                    attrvalue.append(len(values))
+                    values.append(value)
+                continue
+            for target, position in targets:
+                target_row = rows.get(target.int)
+                if target_row is None:
+                    target_row = rows[target.int] = len(uuids)
+                    uuids.append(target.int)
+                refowner.append(row)
+                refname.append(strings(key))
+                reftarget.append(target_row)
+                refposition.append(position)
+    constants = marshal.dumps((tuple(kinds.values), strings.values, values))
+    out.write(_HEADER.pack(MAGIC, len(elements), len(uuids) - len(elements),
+                           len(refowner), len(attrowner), len(constants)))
+    halves = list()
+    for uuid in uuids:
+        halves.append(uuid >> 64)
+        halves.append(uuid & _LOW)
+    out.write(struct.pack('>%sQ' % len(halves), *halves))
+    for table in (kind, parent, name, xmiid, refowner, refname, reftarget,
+                  refposition, attrowner, attrname, attrvalue):
+        if sys.byteorder == 'big':
+            table.byteswap()
+        out.write(table.tostring())
+    out.write(constants)
+
+
+def load(source):
+    """Read a snapshot from source, a file name or file object, and return
+    the model.
+
+    A file given by name is memory mapped and not read as a whole.
+    """
+    if isinstance(source, basestring):
+        with open(source, 'rb') as fd:
+            if not os.fstat(fd.fileno()).st_size:
+                raise ValueError(u"Empty snapshot")
+            data = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            return _load(data)
+        finally:
+            data.close()
+    return _load(source.read())
+
+
+def _load(data, index=None, parent=None, root=None):
+    """Read snapshot data and return its root element.
+
+    ``index``
+      uuid index to register the elements in, a new one if not given.
+
+    ``parent``
+      Parent of the root element. The root element is not added to it.
+
+    ``root``
+      Class of the root element if it differs from the stored one.
+    """
+    # the collector would scan the growing model over and over again while
+    # creating elements, none of which are garbage
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return _read(data, index, parent, root)
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def _read(data, index, parent, root):
+    if data[:len(MAGIC)] != MAGIC:
+        raise ValueError(u"Not a snapshot")
+    count, external, references, attributes, constants = \
+        _HEADER.unpack(data[:_HEADER.size])[1:]
+    offset = _HEADER.size
+    size = 16 * (count + external)
+    halves = struct.unpack('>%sQ' % (2 * (count + external)),
+                           data[offset:offset + size])
+    uuids = [UUID(int=halves[i] << 64 | halves[i + 1])
+             for i in xrange(0, len(halves), 2)]
+    offset += size
+    tables = list()
+    for length in (count,) * 4 + (references,) * 4 + (attributes,) * 3:
+        table = array('i', data[offset:offset + 4 * length])
+        if sys.byteorder == 'big':
+            table.byteswap()
+        tables.append(table)
+        offset += 4 * length
+    kind, parents, name, xmiid, refowner, refname, reftarget, refposition, \
+        attrowner, attrname, attrvalue = tables
+    kinds, strings, values = marshal.loads(data[offset:offset + constants])
+    classes = [_resolve(k) for k in kinds]
+    if root is not None and count:
+        classes.append(root)
+        kind[0] = len(classes) - 1
+    templates = [_template(cls) for cls in classes]
+    if index is None:
+        index = dict()
+    elements = list()
+    for row in xrange(count):
+        k = kind[row]
+        cls = classes[k]
+        attrs, lists = templates[k]
+        element = cls.__new__(cls)
+        state = element.__dict__
+        state.update(attrs)
+        for key in lists:
+            state[key] = list(state[key])
+        uuid = uuids[row]
+        state['_uuid'] = uuid
+        state['_index'] = index
+        index[uuid.int] = element
+        if xmiid[row] != _NONE:
+            state['_xmiid'] = strings[xmiid[row]]
+        key = None
+        if name[row] != _NONE:
+            key = strings[name[row]]
+        state['__name__'] = key
+        if row:
+            owner = elements[parents[row]]
+            state['__parent__'] = owner
+            storage = owner.__dict__.get('_storage')
+            if storage is None:
+                storage = owner.__dict__['_storage'] = odict()
+            storage[key] = element
+        else:
+            state['__parent__'] = parent
+        elements.append(element)
+    for i in xrange(attributes):
+        value = attrvalue[i]
+        if value < 0:
+            value = _SENTINELS[-1 - value]
+        else:
+            value = values[value]
+        elements[attrowner[i]].__dict__[strings[attrname[i]]] = value
+    for i in xrange(references):
+        state = elements[refowner[i]].__dict__
+        key = strings[refname[i]]
+        target = uuids[reftarget[i]]
+        if refposition[i] == _SCALAR:
+            state[key] = target
+        else:
+            if not refposition[i]:
+                state[key] = list()
+            state[key].append(target)
+    return elements and elements[0] or None
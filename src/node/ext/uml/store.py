@@ -0,0 +1,217 @@
+"""Models stored in a SQLite database, loading packages on first access.
+
+The database contains a snapshot of the model without its packages, one
+snapshot per package contained in the model and a table mapping the uuid of
+each element to the package containing it::
+
+    model       data
+    packages    id, position, name, data
+    elements    uuid, package
+
+``load`` returns a ``LazyModel`` holding only the elements of the model
+which are not contained in one of its packages. A package is read when it is
+accessed, or when a reference to one of its elements is resolved.
+"""
+import marshal
+import sqlite3
+from uuid import UUID
+from odict import odict
+from node.ext.uml.core import Model
+from node.ext.uml.interfaces import (
+    IModel,
+    IPackage,
+    provides,
+)
+from node.ext.uml.indexing import walk
+from node.ext.uml.snapshot import (
+    _write,
+    _load,
+)
+
+
+SCHEMA = """\
+CREATE TABLE model (data BLOB);
+CREATE TABLE packages (
+    id INTEGER PRIMARY KEY,
+    position INTEGER,
+    name BLOB,
+    data BLOB
+);
+CREATE TABLE elements (uuid TEXT PRIMARY KEY, package INTEGER);
+"""
+
+_MISSING = object()
+
+
+class _Writer(object):
+    """File like object collecting the data written to it.
+    """
+
+    def __init__(self):
+        self.data = list()
+
+    def write(self, data):
+        self.data.append(data)
+
+    def getvalue(self):
+        return buffer(''.join(self.data))
+
+
+def _snapshot(nodes):
+    out = _Writer()
+    _write(nodes, out)
+    return out.getvalue()
+
+
+def _outside(model):
+    """Iterate over model and all nodes contained in it but not contained in
+    one of its packages.
+    """
+    yield model
+    for child in model.values():
+        if not IPackage.providedBy(child):
+            for node in walk(child):
+                yield node
+
+
+def dump(model, path):
+    """Write model to a new SQLite database at path.
+    """
+    if not IModel.providedBy(model):
+        raise ValueError(u"Only models can be stored")
+    connection = sqlite3.connect(path)
+    try:
+        connection.executescript(SCHEMA)
+        connection.execute('INSERT INTO model VALUES (?)',
+                           (_snapshot(_outside(model)),))
+        for position, child in enumerate(model.values()):
+            if not IPackage.providedBy(child):
+                continue
+            nodes = list(walk(child))
+            cursor = connection.execute(
+                'INSERT INTO packages (position, name, data) VALUES (?, ?, ?)',
+                (position, buffer(marshal.dumps(child.__name__)),
+                 _snapshot(nodes)))
+            connection.executemany(
+                'INSERT INTO elements VALUES (?, ?)',
+                [(node.uuid.hex, cursor.lastrowid) for node in nodes])
+        connection.commit()
+    finally:
+        connection.close()
+
+
+def load(path):
+    """Open the SQLite database at path written by ``dump`` and return the
+    model.
+    """
+    connection = sqlite3.connect(path)
+    data, = connection.execute('SELECT data FROM model').fetchone()
+    index = _LazyIndex(connection)
+    model = _load(str(data), index=index, root=LazyModel)
+    packages = dict()
+    for id, position, name in connection.execute(
+            'SELECT id, position, name FROM packages'):
+        packages[position] = id, marshal.loads(str(name))
+    children = model.storage.items()
+    storage = odict()
+    for position in xrange(len(packages) + len(children)):
+        if position in packages:
+            id, key = packages[position]
+            storage[key] = _Unloaded(id)
+            index.packages[id] = key
+        else:
+            key, child = children.pop(0)
+            storage[key] = child
+    model._storage = storage
+    index.model = model
+    return model
+
+
+class _Unloaded(object):
+    """Placeholder of a package not read yet.
+    """
+
+    def __init__(self, id):
+        self.id = id
+
+
+class _LazyIndex(dict):
+    """uuid index of a ``LazyModel``, reading the package containing an
+    element looked up but not read yet.
+
+    Keeps the database connection and the ids of the packages not read yet.
+    """
+    model = None
+
+    def __init__(self, connection):
+        super(_LazyIndex, self).__init__()
+        self.connection = connection
+        self.packages = dict()
+
+    def get(self, key, default=None):
+        node = dict.get(self, key, _MISSING)
+        if node is _MISSING:
+            if self.model is None or not self.model._loaduuid(key):
+                return default
+            node = dict.get(self, key, default)
+        return node
+
+
+class LazyModel(Model):
+    """Model read from a database by ``load``, reading its packages on first
+    access.
+
+    All ways of accessing children go through ``__getitem__``, so iterating
+    over the values of the model reads all packages. Building a reverse index
+    reads the whole model. Views of children not being packages, like
+    ``classes`` or ``stereotypes``, do not read packages.
+    """
+    def __getitem__(self, key):
+        node = super(LazyModel, self).__getitem__(key)
+        if isinstance(node, _Unloaded):
+            node = self._loadpackage(key, node.id)
+        return node
+
+    def _bucketentries(self, keys, interface):
+        # placeholders stand for packages, other views skip them
+        if IPackage.isOrExtends(interface):
+            return super(LazyModel, self)._bucketentries(keys, interface)
+        entries = odict()
+        storage = self.storage
+        for key in keys:
+            value = storage[key]
+            if not isinstance(value, _Unloaded) and provides(value, interface):
+                entries[key] = value
+        return entries
+
+    @property
+    def loaded(self):
+        """Names of the packages read so far.
+        """
+        return [key for key, node in self.storage.items()
+                if IPackage.providedBy(node)]
+
+    def _loadpackage(self, key, id):
+        index = self._index
+        data, = index.connection.execute(
+            'SELECT data FROM packages WHERE id = ?', (id,)).fetchone()
+        package = _load(str(data), index=index, parent=self)
+        self.storage[key] = package
+        self._buckets = None
+        del index.packages[id]
+        return package
+
+    def _loaduuid(self, key):
+        """Read the package containing the element with uuid key, return
+        whether it was read.
+        """
+        packages = self._index.packages
+        if not packages:
+            return False
+        row = self._index.connection.execute(
+            'SELECT package FROM elements WHERE uuid = ?',
+            (UUID(int=key).hex,)).fetchone()
+        if row is None or row[0] not in packages:
+            return False
+        self._loadpackage(packages[row[0]], row[0])
+        return True
@@ -0,0 +1,805 @@
+"""Benchmarks for node.ext.uml.
+
+Run all benchmarks or the ones given by name like so::
+
+    ./bin/py -m node.ext.uml.testing.benchmark [name ...]
+"""
+import sys
+import time
+from node.ext.uml.core import Model
+from node.ext.uml.classes import (
+    Class,
+    Generalization,
+    Association,
+    AssociationEnd,
+)
+
+
+BENCHMARKS = list()
+
+
+def benchmark(func):
+    BENCHMARKS.append(func)
+    return func
+
+
+def timed(func, *args, **kw):
+    """Return seconds needed to call func.
+    """
+    start = time.time()
+    func(*args, **kw)
+    return time.time() - start
+
+
+def report(label, seconds, count=1):
+    print '    %-40s %10.3f ms %12.3f us/op' % (
+        label, seconds * 1000, seconds * 1000000 / count)
+
+
+def class_hierarchy(size, fanout=4):
+    """Model with ``size`` classes, each inheriting from the class
+    ``size // fanout`` positions before it.
+    """
+    model = Model('model')
+    classes = list()
+    for i in range(size):
+        cls = model['C%s' % i] = Class()
+        if i:
+            cls['g'] = Generalization()
+            cls['g'].general = classes[(i - 1) // fanout]
+        classes.append(cls)
+    return model, classes
+
+
+@benchmark
+def inheritors():
+    """Inheritors.direct per class on growing models.
+    """
+    from node.ext.uml.utils import Inheritors
+    for size in (1000, 10000, 80000):
+        model, classes = class_hierarchy(size)
+        sample = classes[::max(1, size // 500)]
+        report('%s classes, first lookup' % size,
+               timed(lambda: Inheritors(classes[0]).direct))
+        report('%s classes, direct' % size,
+               timed(lambda: [Inheritors(c).direct for c in sample]),
+               len(sample))
+
+
+def diamond_lattice(layers, width):
+    """Model with ``layers`` layers of ``width`` classes, each class
+    inheriting from two classes of the layer above.
+    """
+    model = Model('model')
+    above = list()
+    classes = list()
+    for layer in range(layers):
+        current = list()
+        for i in range(width):
+            cls = model['L%sC%s' % (layer, i)] = Class()
+            if above:
+                for j, general in enumerate((above[i], above[(i + 1) % width])):
+                    cls['g%s' % j] = Generalization()
+                    cls['g%s' % j].general = general
+            current.append(cls)
+        classes += current
+        above = current
+    return model, classes
+
+
+@benchmark
+def inheritance():
+    """Inheritance.all on deep, wide and diamond shaped hierarchies.
+    """
+    from node.ext.uml.utils import Inheritance
+    for label, (model, classes) in (
+            ('deep, 500 classes', class_hierarchy(500, fanout=1)),
+            ('wide, 20000 classes', class_hierarchy(20000, fanout=50)),
+            ('diamonds, 20x50 classes', diamond_lattice(20, 50))):
+        sample = classes[-100:]
+        report('%s, cold' % label,
+               timed(lambda: [Inheritance(c).all for c in sample]),
+               len(sample))
+        report('%s, cached' % label,
+               timed(lambda: [Inheritance(c).all for c in sample]),
+               len(sample))
+
+
+@benchmark
+def closure():
+    """Ancestors and descendants of all classes, adapters versus closure.
+    """
+    from node.ext.uml.utils import (
+        Inheritance,
+        Inheritors,
+        GeneralizationClosure,
+    )
+    for label, (model, classes) in (
+            ('tree, 5000 classes', class_hierarchy(5000)),
+            ('diamonds, 20x100 classes', diamond_lattice(20, 100))):
+
+        def adapters():
+            for cls in classes:
+                Inheritance(cls).mro
+                Inheritors(cls).all
+
+        def closure():
+            closure = GeneralizationClosure(model)
+            for cls in classes:
+                closure.ancestors(cls)
+                closure.descendants(cls)
+        report('%s, adapters' % label, timed(adapters), len(classes))
+        report('%s, closure' % label, timed(closure), len(classes))
+
+
+def stereotyped_model(packages, classes, depth=1):
+    """Model with ``packages`` packages nested ``depth`` levels deep, the
+    innermost containing ``classes`` classes. Every package and every third
+    class has stereotype ``st`` with tagged value ``tag`` applied, classes
+    inherit from the previous class in the package.
+    """
+    from node.ext.uml.core import (
+        Package,
+        Stereotype,
+        TaggedValue,
+    )
+
+    def apply(element, value):
+        element['st'] = Stereotype()
+        element['st']['tag'] = TaggedValue()
+        element['st']['tag'].value = value
+
+    model = Model('model')
+    apply(model, 'model')
+    for i in range(packages):
+        package = model
+        for level in range(depth):
+            package['P%s' % i] = Package()
+            package = package['P%s' % i]
+            apply(package, 'P%s' % i)
+        previous = None
+        for j in range(classes):
+            cls = package['C%s' % j] = Class()
+            if not j % 3:
+                apply(cls, 'P%sC%s' % (i, j))
+            if previous is not None:
+                cls['g'] = Generalization()
+                cls['g'].general = previous
+            previous = cls
+    return model
+
+
+@benchmark
+def taggedvalues():
+    """Tagged values of all classes, per element versus ModelTaggedValues.
+    """
+    from node.ext.uml.interfaces import IClass
+    from node.ext.uml.indexing import walk
+    from node.ext.uml.utils import (
+        TaggedValues,
+        ModelTaggedValues,
+    )
+    model = stereotyped_model(20, 100, depth=5)
+    classes = [n for n in walk(model) if IClass.providedBy(n)]
+    for kind in ('namespaced', 'inherited'):
+        for aggregate in (True, False):
+            label = '%s classes, %s, aggregate=%s' % (
+                len(classes), kind, aggregate)
+            report(label + ', per element',
+                   timed(lambda: [getattr(TaggedValues(c), kind)(
+                       'st:tag', aggregate=aggregate) for c in classes]),
+                   len(classes))
+            report(label + ', bulk',
+                   timed(lambda: getattr(ModelTaggedValues(model, IClass),
+                                         kind)('st:tag', aggregate=aggregate)),
+                   len(classes))
+            query = lambda: [getattr(TaggedValues(c, cached=True), kind)(
+                'st:tag', aggregate=aggregate) for c in classes]
+            report(label + ', cached, cold', timed(query), len(classes))
+            report(label + ', cached, warm', timed(query), len(classes))
+
+
+@benchmark
+def stereotypes():
+    """Elements with stereotype ``st`` applied, tree walk versus index.
+    """
+    from node.ext.uml.indexing import walk
+    from node.ext.uml.utils import StereotypeApplications
+    model = stereotyped_model(20, 1000)
+    count = 10
+    report('walk', timed(lambda: [
+        [n for n in walk(model) if n.stereotype('st') is not None]
+        for _ in range(count)]), count)
+    applications = StereotypeApplications(model)
+    report('index, first use', timed(lambda: applications.count(None, 'st')))
+    report('index', timed(lambda: [
+        list(applications.elements(None, 'st')) for _ in range(count)]),
+        count)
+    report('index count', timed(lambda: [
+        applications.count(None, 'st') for _ in range(count)]), count)
+
+
+@benchmark
+def taggedvaluelookup():
+    """Classes by tagged value, walk with TaggedValues.direct versus index.
+    """
+    from node.ext.uml.interfaces import IClass
+    from node.ext.uml.indexing import walk
+    from node.ext.uml.utils import (
+        TaggedValues,
+        TaggedValueLookup,
+    )
+    model = stereotyped_model(20, 1000)
+    count = 10
+    report('walk, equal', timed(lambda: [
+        [n for n in walk(model) if IClass.providedBy(n)
+         and TaggedValues(n).direct('st:tag', default=None) == 'P5C30']
+        for _ in range(count)]), count)
+    report('walk, prefix', timed(lambda: [
+        [n for n in walk(model) if IClass.providedBy(n)
+         and (TaggedValues(n).direct('st:tag', default=None) or ''
+              ).startswith('P5C')]
+        for _ in range(count)]), count)
+    lookup = TaggedValueLookup(model, IClass)
+    report('index, first use', timed(lambda: lookup.equal('st:tag', 'P5C30')))
+    report('index, equal', timed(lambda: [
+        lookup.equal('st:tag', 'P5C30') for _ in range(count)]), count)
+    report('index, prefix', timed(lambda: [
+        lookup.prefix('st:tag', 'P5C') for _ in range(count)]), count)
+
+
+@benchmark
+def impact():
+    """Elements affected by changing the root of a 20k class hierarchy with
+    20k dependencies, scan versus Impact.
+    """
+    from node.ext.uml.classes import Dependency
+    from node.ext.uml.interfaces import (
+        IDependency,
+        IGeneralization,
+    )
+    from node.ext.uml.indexing import walk
+    from node.ext.uml.utils import Impact
+    model, classes = class_hierarchy(20000)
+    for i in range(1, len(classes)):
+        dependency = model['D%s' % i] = Dependency()
+        dependency.client = classes[i]
+        dependency.supplier = classes[i - 1]
+
+    def scan():
+        # one model walk per level of affected elements
+        seen = set([classes[0].uuid])
+        level = [classes[0]]
+        while level:
+            uuids = set([element.uuid for element in level])
+            level = list()
+            for node in walk(model):
+                if IDependency.providedBy(node):
+                    affected, cause = node.client, node._supplier
+                elif IGeneralization.providedBy(node):
+                    affected, cause = node.__parent__, node._general
+                else:
+                    continue
+                if cause in uuids and affected.uuid not in seen:
+                    seen.add(affected.uuid)
+                    level.append(affected)
+            if len(seen) > 100:
+                break
+        return seen
+    report('scan, first 100 affected', timed(scan))
+    analysis = Impact(model)
+    report('Impact, first use', timed(
+        lambda: analysis.dependents([classes[0]])))
+    count = 10
+    report('Impact, all %s affected' % (len(classes) - 1), timed(lambda: [
+        analysis.dependents([classes[0]]) for _ in range(count)]), count)
+    report('Impact, leaf', timed(lambda: [
+        analysis.dependents([classes[-1]]) for _ in range(count)]), count)
+
+
+def associate(model, classes, count):
+    """Add ``count`` associations between neighbouring classes, every
+    second one aggregating.
+    """
+    for i in range(count):
+        assoc = model['A%s' % i] = Association()
+        src = assoc['src'] = AssociationEnd()
+        src.association = assoc
+        src.type = classes[i % len(classes)]
+        dst = assoc['dst'] = AssociationEnd()
+        dst.association = assoc
+        dst.type = classes[(i + 1) % len(classes)]
+        if i % 2:
+            dst.aggregationkind = AssociationEnd.COMPOSITE
+
+
+@benchmark
+def associations():
+    """Associations, Aggregations and Aggregators per class.
+    """
+    from node.ext.uml.utils import (
+        Associations,
+        Aggregations,
+        Aggregators,
+    )
+    for size in (1000, 10000):
+        model, classes = class_hierarchy(size)
+        associate(model, classes, size * 2)
+        sample = classes[::max(1, size // 200)]
+        report('%s classes, index build' % size,
+               timed(lambda: Associations(classes[0]).all))
+        for adapter in (Associations, Aggregations, Aggregators):
+            report('%s classes, %s.all' % (size, adapter.__name__),
+                   timed(lambda: [adapter(c).all for c in sample]),
+                   len(sample))
+
+
+def activity_model(blocks, packages=1):
+    """Model with ``packages`` packages, each containing an activity with
+    ``blocks`` decision/merge and fork/join blocks chained between an initial
+    and a final node. The first package is called ``package``.
+    """
+    from node.ext.uml.core import Package
+    from node.ext.uml import activities as a
+    model = Model('model')
+    for i in range(packages):
+        name = i and 'package%s' % i or 'package'
+        model[name] = Package()
+        model[name]['activity'] = a.Activity()
+        fill_activity(model[name]['activity'], blocks)
+    return model
+
+
+def fill_activity(act, blocks):
+    from node.ext.uml import activities as a
+    counter = [0]
+
+    def add(node):
+        counter[0] += 1
+        act['n%s' % counter[0]] = node
+        return node
+
+    def connect(source, target):
+        counter[0] += 1
+        act['e%s' % counter[0]] = a.ActivityEdge(source=source, target=target)
+
+    last = add(a.InitialNode())
+    for i in range(blocks):
+        if i % 2:
+            split, join = add(a.DecisionNode()), add(a.MergeNode())
+        else:
+            split, join = add(a.ForkNode()), add(a.JoinNode())
+        connect(last, split)
+        for j in range(2):
+            action = add(a.OpaqueAction())
+            connect(split, action)
+            connect(action, join)
+        last = add(a.OpaqueAction())
+        connect(join, last)
+    connect(last, add(a.ActivityFinalNode()))
+
+
+@benchmark
+def activityedges():
+    """incoming_edges/outgoing_edges on all nodes of growing activities.
+    """
+    for blocks in (200, 2000):
+        model = activity_model(blocks)
+        nodes = list(model['package']['activity'].nodes)
+
+        def query():
+            for node in nodes:
+                list(node.incoming_edges)
+                list(node.outgoing_edges)
+        report('%s nodes' % len(nodes), timed(query), len(nodes))
+
+
+@benchmark
+def validation():
+    """validate with per node edge lookup and with one sweep per activity.
+    """
+    from node.ext.uml.activities import validate
+    for blocks in (500, 2500):
+        model = activity_model(blocks)
+        nodes = len(list(model['package']['activity'].nodes))
+        report('%s nodes, validate' % nodes, timed(validate, model), nodes)
+        report('%s nodes, validate sweep' % nodes,
+               timed(validate, model, sweep=True), nodes)
+
+
+@benchmark
+def incremental():
+    """validate versus IncrementalValidator after changing one edge.
+    """
+    from node.ext.uml.activities import (
+        validate,
+        IncrementalValidator,
+    )
+    for blocks in (500, 2500):
+        model = activity_model(blocks)
+        activity = model['package']['activity']
+        nodes = len(list(activity.nodes))
+        edge = activity.values()[-1]
+        validator = IncrementalValidator(model)
+        report('%s nodes, first run' % nodes, timed(validator.validate))
+
+        def change():
+            edge.target = edge.target
+        # builds the edge indexes
+        report('%s nodes, first change' % nodes,
+               timed(lambda: [change(), validator.validate()]))
+        report('%s nodes, validate' % nodes,
+               timed(lambda: [change(), validate(model, sweep=True)]))
+        report('%s nodes, incremental' % nodes,
+               timed(lambda: [change(), validator.validate()]))
+        validator.close()
+    # every second node invalid
+    from node.ext.uml.activities import (
+        DecisionNode,
+        ActivityEdge,
+        validate_all,
+    )
+    model = activity_model(1)
+    activity = model['package']['activity']
+    for i in range(4000):
+        activity['n%s' % i] = DecisionNode()
+        if i % 2:
+            activity['e%s' % i] = ActivityEdge(
+                source=activity['n%s' % (i - 1)], target=activity['n%s' % i])
+    validator = IncrementalValidator(model)
+    report('%s violations, first run' % len(validator.errors), timed(
+        lambda: validator.errors))
+    # change rebinds the target of this edge from now on
+    edge = activity['e1']
+    report('%s violations, validate_all' % len(validator.errors),
+           timed(lambda: [change(), validate_all(model)]))
+    report('%s violations, incremental' % len(validator.errors),
+           timed(lambda: [change(), validator.errors]))
+    validator.close()
+
+
+@benchmark
+def parallel():
+    """validate_all on 16 packages, sequential and with worker processes.
+    """
+    import multiprocessing
+    from node.ext.uml.activities import validate_all
+    model = activity_model(300, packages=16)
+    report('16 packages, sequential', timed(validate_all, model))
+    for processes in (2, 4, multiprocessing.cpu_count()):
+        report('16 packages, %s processes' % processes,
+               timed(validate_all, model, processes))
+
+
+@benchmark
+def xmiids():
+    """get_element_by_xmiid on growing models.
+    """
+    from node.ext.uml.activities import get_element_by_xmiid
+    for size in (1000, 10000, 50000):
+        model, classes = class_hierarchy(size)
+        for i, cls in enumerate(classes):
+            cls.xmiid = 'id%s' % i
+        ids = ['id%s' % i for i in range(0, size, max(1, size // 1000))]
+        report('%s classes, first lookup' % size,
+               timed(get_element_by_xmiid, model, ids[-1]))
+        report('%s classes, lookup' % size,
+               timed(lambda: [get_element_by_xmiid(model, i) for i in ids]),
+               len(ids))
+
+
+@benchmark
+def mutation():
+    """Adding classes and generalizations, plain versus change tracking.
+    """
+    size = 5000
+
+    def build(setup):
+        model = Model('model')
+        setup(model)
+        classes = list()
+
+        def mutate():
+            for i in range(size):
+                cls = model['C%s' % i] = Class()
+                cls['g'] = Generalization()
+                if classes:
+                    cls['g'].general = classes[i // 2]
+                classes.append(cls)
+        return mutate
+
+    for label, setup in (
+            ('plain', lambda model: None),
+            ('generation', lambda model: model.generation),
+            ('subscriber', lambda model: model.subscribe(lambda change: None)),
+            ('indexes', lambda model: model.modelindex('generalizations'))):
+        report('%s classes, %s' % (size, label), timed(build(setup)), size)
+
+
+def xmi_document(packages, classes):
+    """XMI document with ``packages`` packages of ``classes`` classes, each
+    inheriting from the next class, having an attribute typed by the previous
+    class and a stereotype applied.
+    """
+    out = ['<xmi:XMI xmi:version="2.1" '
+           'xmlns:xmi="http://schema.omg.org/spec/XMI/2.1" '
+           'xmlns:uml="http://www.eclipse.org/uml2/3.0.0/UML" '
+           'xmlns:pr="http:///schemas/pr/1">',
+           '<uml:Model xmi:id="model" name="model">']
+    for i in range(packages):
+        out.append('<packagedElement xmi:type="uml:Package" xmi:id="P%s" '
+                   'name="P%s">' % (i, i))
+        for j in range(classes):
+            cid = 'P%sC%s' % (i, j)
+            out.append('<packagedElement xmi:type="uml:Class" xmi:id="%s" '
+                       'name="C%s">' % (cid, j))
+            if j < classes - 1:
+                out.append('<generalization xmi:id="%sg" general="P%sC%s"/>'
+                           % (cid, i, j + 1))
+            out.append('<ownedAttribute xmi:id="%sa" name="a" type="P%sC%s">'
+                       '<defaultValue xmi:type="uml:LiteralString" '
+                       'value="x"/></ownedAttribute>'
+                       % (cid, i, max(0, j - 1)))
+            out.append('</packagedElement>')
+        out.append('</packagedElement>')
+    out.append('</uml:Model>')
+    for i in range(packages):
+        for j in range(classes):
+            out.append('<pr:st xmi:id="P%sC%ss" base_Class="P%sC%s" tag="v"/>'
+                       % (i, j, i, j))
+    out.append('</xmi:XMI>')
+    return '\n'.join(out)
+
+
+@benchmark
+def xmiimport():
+    """Streaming XMI import, elements per second.
+    """
+    from StringIO import StringIO
+    from node.ext.uml.xmi import XMIImporter
+    for packages, classes in ((10, 100), (50, 200)):
+        document = xmi_document(packages, classes)
+        importer = XMIImporter()
+        seconds = timed(importer.parse, StringIO(document))
+        report('%s elements, %s kB' % (importer.count, len(document) // 1024),
+               seconds, importer.count)
+        print '    %-40s %10d elements/s' % ('', importer.count / seconds)
+
+
+@benchmark
+def xmiexport():
+    """Streaming XMI export, elements per second.
+    """
+    from StringIO import StringIO
+    from node.ext.uml.xmi import (
+        XMIImporter,
+        XMIExporter,
+    )
+    for packages, classes in ((10, 100), (50, 200)):
+        model = XMIImporter().parse(StringIO(xmi_document(packages, classes)))
+        exporter = XMIExporter(StringIO())
+        seconds = timed(exporter.write, model)
+        report('%s elements' % exporter.count, seconds, exporter.count)
+        print '    %-40s %10d elements/s' % ('', exporter.count / seconds)
+
+
+@benchmark
+def snapshot():
+    """Binary snapshot save and load compared to XMI import.
+    """
+    import os
+    import tempfile
+    from StringIO import StringIO
+    from node.ext.uml.xmi import XMIImporter
+    from node.ext.uml import snapshot
+    for packages, classes in ((10, 100), (50, 200)):
+        document = xmi_document(packages, classes)
+        importer = XMIImporter()
+        parse = timed(importer.parse, StringIO(document))
+        model = importer.model
+        count = importer.count
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            save = timed(snapshot.dump, model, path)
+            load = timed(snapshot.load, path)
+            size = os.path.getsize(path)
+        finally:
+            os.remove(path)
+        report('%s elements, xmi import' % count, parse, count)
+        report('%s elements, save %s kB' % (count, size // 1024), save, count)
+        report('%s elements, load' % count, load, count)
+        print '    %-40s %10.1f x' % ('load speedup over xmi', parse / load)
+
+
+@benchmark
+def lazyload():
+    """Lazy model startup and first access of one package compared to
+    loading the whole snapshot.
+    """
+    import gc
+    import os
+    import tempfile
+    from StringIO import StringIO
+    from node.ext.uml.xmi import XMIImporter
+    from node.ext.uml import snapshot
+    from node.ext.uml import store
+    for packages, classes in ((10, 100), (50, 200)):
+        importer = XMIImporter()
+        model = importer.parse(StringIO(xmi_document(packages, classes)))
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'model.db')
+            store.dump(model, path)
+            snapshotpath = os.path.join(directory, 'model.snapshot')
+            snapshot.dump(model, snapshotpath)
+            full = timed(snapshot.load, snapshotpath)
+            # do not count collecting the models created so far
+            gc.collect()
+            start = time.time()
+            lazy = store.load(path)
+            startup = time.time() - start
+            first = timed(lambda: lazy['P0']['C0'].stereotype('st'))
+            follow = timed(lambda: lazy.node(model['P1']['C0'].uuid))
+        finally:
+            for name in os.listdir(directory):
+                os.remove(os.path.join(directory, name))
+            os.rmdir(directory)
+        label = '%s elements' % importer.count
+        report('%s, snapshot' % label, full)
+        report('%s, startup' % label, startup)
+        report('%s, package' % label, first)
+        report('%s, reference' % label, follow)
+
+
+@benchmark
+def dereference():
+    """Reading reference properties compared to looking up the stored uuid.
+    """
+    from node.ext.uml.classes import Property
+    from node.ext.uml.activities import ActivityEdge
+    model, classes = class_hierarchy(100)
+    associate(model, classes, 1)
+    prop = classes[0]['p'] = Property()
+    prop.type = classes[1]
+    generalization = classes[1]['g']
+    association = model['A0']
+    association.memberEnds = association.values()
+    act = activity_model(1)['package']['activity']
+    edge = [v for v in act.values() if isinstance(v, ActivityEdge)][0]
+    count = 100000
+    for label, read, lookup in (
+            ('type', lambda: prop.type,
+             lambda: prop.node(prop._type)),
+            ('general', lambda: generalization.general,
+             lambda: generalization.node(generalization._general)),
+            ('source', lambda: edge.source,
+             lambda: edge.node(edge.source_uuid)),
+            ('memberEnds', lambda: association.memberEnds,
+             lambda: [association.node(uuid)
+                      for uuid in association._memberEnds])):
+        report('%s, uuid lookup' % label,
+               timed(lambda: [lookup() for _ in xrange(count)]), count)
+        report('%s, property' % label,
+               timed(lambda: [read() for _ in xrange(count)]), count)
+
+
+@benchmark
+def bulkadd():
+    """Adding classes one by one compared to adding them at once.
+    """
+    def single(model, classes):
+        for i, cls in enumerate(classes):
+            model['C%s' % i] = cls
+
+    def bulk(model, classes):
+        model.bulk_add([('C%s' % i, cls) for i, cls in enumerate(classes)])
+
+    for size in (10000, 100000):
+        for label, add in (('one by one', single), ('at once', bulk)):
+            model = Model('model')
+            model.modelindex('generalizations')
+            classes = [Class() for _ in xrange(size)]
+            report('%s classes, %s' % (size, label),
+                   timed(add, model, classes), size)
+
+
+@benchmark
+def buckets():
+    """Listing the classes of a package with 5k classes and 20k associations.
+    """
+    from node.ext.uml.core import Package
+    from node.ext.uml.interfaces import IClass
+    package = Package('package')
+    items = list()
+    for i in range(5000):
+        items.append(('C%s' % i, Class()))
+        for j in range(4):
+            items.append(('A%s-%s' % (i, j), Association()))
+    package.bulk_add(items)
+    count = 20
+    report('filtered values', timed(lambda: [
+        list(package.filtereditervalues(IClass)) for _ in range(count)]),
+        count)
+    report('bucket, first use', timed(lambda: list(package.classes)))
+    report('bucket', timed(lambda: [
+        list(package.classes) for _ in range(count)]), count)
+    report('bucket length', timed(lambda: [
+        len(package.classes) for _ in range(count)]), count)
+
+
+@benchmark
+def kinds():
+    """Type tests of 100k model elements, through zope.interface and through
+    the interface bitmasks.
+    """
+    from node.ext.uml.indexing import walk
+    from node.ext.uml.interfaces import (
+        IGeneralization,
+        provides,
+    )
+    model, classes = class_hierarchy(5000)
+    associate(model, classes, 5000)
+    elements = list(walk(model))
+    elements = (elements * (100000 // len(elements) + 1))[:100000]
+    report('providedBy', timed(lambda: [
+        e for e in elements if IGeneralization.providedBy(e)]),
+        len(elements))
+    report('provides', timed(lambda: [
+        e for e in elements if provides(e, IGeneralization)]),
+        len(elements))
+
+
+def footprint(element):
+    """Approximate bytes used by element, its attribute dict, child storage
+    and uuid, not counting attribute values shared with other elements.
+    """
+    size = sys.getsizeof(element) + sys.getsizeof(element.__dict__)
+    size += sys.getsizeof(element._uuid)
+    storage = element.__dict__.get('_storage')
+    if storage is not None:
+        size += sys.getsizeof(storage) + sys.getsizeof(storage.__dict__)
+    return size
+
+
+@benchmark
+def memory():
+    """Bytes per element of leaf element types contained in a model.
+    """
+    from node.ext.uml.core import TaggedValue
+    from node.ext.uml.classes import (
+        Property,
+        Parameter,
+    )
+    from node.ext.uml.activities import (
+        OpaqueAction,
+        ActivityEdge,
+    )
+    model, classes = class_hierarchy(2)
+    associate(model, classes, 1)
+    model['C0']['p'] = Property()
+    model['C0']['p'].type = model['C1']
+    model['C0']['o'] = Parameter()
+    model['C0']['o'].type = model['C1']
+    model['C0']['t'] = TaggedValue()
+    model['C0']['t'].value = 'value'
+    model['C0']['a'] = OpaqueAction()
+    model['C0']['e'] = ActivityEdge(source=model['C0']['a'],
+                                    target=model['C0']['a'])
+    for element in (model['C0']['p'], model['C0']['o'], model['C0']['t'],
+                    model['A0']['dst'], model['C0']['e'], model['C1']['g']):
+        print '    %-40s %10s bytes' % (element.__class__.__name__,
+                                         footprint(element))
+
+
+def main(argv):
+    names = argv[1:]
+    for func in BENCHMARKS:
+        if names and func.__name__ not in names:
+            continue
+        print '%s: %s' % (func.__name__, func.__doc__.strip())
+        func()
+
+
+if __name__ == '__main__':
+    main(sys.argv)
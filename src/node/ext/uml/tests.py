@@ -13,9 +13,13 @@ optionflags = doctest.NORMALIZE_WHITESPACE | \
 
 TESTFILES = [
     'core.rst',
+    'indexing.rst',
     'classes.rst',
     'activities.rst',
     'utils.rst',
+    'xmi.rst',
+    'snapshot.rst',
+    'store.rst',
 ]
 
 
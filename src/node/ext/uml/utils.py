@@ -1,12 +1,148 @@
+from bisect import (
+    bisect_left,
+    insort,
+)
+from uuid import UUID
+from odict import odict
 from node.base import OrderedNode
+from node.ext.uml.indexing import (
+    ReverseIndex,
+    register_index,
+    register_cache,
+    walk,
+)
 from node.ext.uml.interfaces import (
+    ModelIllFormedException,
+    IUMLElement,
+    IStereotype,
+    ITaggedValue,
     IGeneralization,
     IAssociationEnd,
-    IInterfaceRealization
+    IInterfaceRealization,
+    provides,
 )
 from node.ext.uml.classes import AssociationEnd
 
 
+def _c3merge(sequences):
+    """Merge linearizations as done by C3. If the hierarchy is inconsistent the
+    first remaining head is taken.
+    """
+    sequences = [seq for seq in sequences if seq]
+    positions = [0] * len(sequences)
+    tails = dict()
+    for seq in sequences:
+        for element in seq[1:]:
+            tails[element.uuid] = tails.get(element.uuid, 0) + 1
+
+    def advance(i):
+        positions[i] += 1
+        if positions[i] < len(sequences[i]):
+            tails[sequences[i][positions[i]].uuid] -= 1
+
+    result = list()
+    done = set()
+    while True:
+        candidate = fallback = None
+        for i, seq in enumerate(sequences):
+            while positions[i] < len(seq) and seq[positions[i]].uuid in done:
+                advance(i)
+            if positions[i] == len(seq):
+                continue
+            head = seq[positions[i]]
+            if fallback is None:
+                fallback = head
+            if not tails.get(head.uuid):
+                candidate = head
+                break
+        if candidate is None:
+            candidate = fallback
+        if candidate is None:
+            return result
+        result.append(candidate)
+        done.add(candidate.uuid)
+        for i, seq in enumerate(sequences):
+            if positions[i] < len(seq) and seq[positions[i]] is candidate:
+                advance(i)
+
+
+class Linearizations(object):
+    """Model wide cache of C3 linearizations of the generalization hierarchy.
+
+    A linearization gets invalidated if a Generalization of one of the
+    elements it contains changes, or if one of these elements is removed.
+    """
+
+    def __init__(self):
+        self._linearizations = dict()
+        self._dependents = dict()
+
+    def get(self, element):
+        """Tuple of element and its more general elements in C3 order.
+        """
+        linearization = self._linearizations.get(element.uuid)
+        if linearization is not None:
+            return linearization
+        # iterative post order walk, deep hierarchies exceed recursion limit
+        visiting = set()
+        stack = [element]
+        while stack:
+            current = stack[-1]
+            if current.uuid in self._linearizations:
+                stack.pop()
+                continue
+            visiting.add(current.uuid)
+            generals = list()
+            seen = set()
+            dangling = list()
+            pending = False
+            for generalization in \
+                    current.filtereditervalues(IGeneralization):
+                general = generalization.general
+                if general is None:
+                    dangling.append(generalization._general)
+                    continue
+                if general.uuid in seen:
+                    continue
+                seen.add(general.uuid)
+                if general.uuid not in self._linearizations:
+                    # generalization cycles are cut at the closing edge
+                    if general.uuid in visiting:
+                        continue
+                    stack.append(general)
+                    pending = True
+                generals.append(general)
+            if pending:
+                continue
+            stack.pop()
+            visiting.discard(current.uuid)
+            sequences = [self._linearizations[g.uuid] for g in generals]
+            sequences.append(generals)
+            linearization = tuple([current] + _c3merge(sequences))
+            self._linearizations[current.uuid] = linearization
+            for dependency in linearization:
+                self._dependents.setdefault(dependency.uuid, set()).add(
+                    current.uuid)
+            for uuid in dangling:
+                self._dependents.setdefault(uuid, set()).add(current.uuid)
+        return self._linearizations[element.uuid]
+
+    def invalidate(self, node):
+        if provides(node, IGeneralization):
+            node = node.__parent__
+            if node is None:
+                return
+        stack = [node.uuid]
+        while stack:
+            dependents = self._dependents.pop(stack.pop(), ())
+            for uuid in dependents:
+                if self._linearizations.pop(uuid, None) is not None:
+                    stack.append(uuid)
+
+
+register_cache('linearizations', IUMLElement, Linearizations)
+
+
 class Inheritance(OrderedNode):
     """Tree giving the inheritance tree point of view of arbitary UML-elements.
 
@@ -51,21 +187,25 @@ class Inheritance(OrderedNode):
         return '%s on %s' % (super(Inheritance, self).noderepr,
                              self.context.__name__)
 
+    @property
+    def mro(self):
+        """C3 linearization of the generalization hierarchy. Cached model wide
+        until a Generalization in the hierarchy changes.
+
+        @return: tuple of UMLElements, starting with the adapted one.
+        """
+        return self.context.modelcache('linearizations').get(self.context)
+
     @property
     def all(self):
         """flattend (list) from the traversed tree of more general
-        UML-elements.
+        UML-elements, ordered like ``mro``.
 
-        @return: list of UMLElements.
+        @return: list of Inheritance instances.
         """
-        result = list()
-        result.append(self)
-        for value in self.values():
-            subs = value.all
-            for sub in subs:
-                if sub.__name__ in [r.__name__ for r in result]:
-                    continue
-                result.append(sub)
+        result = [self]
+        for element in self.mro[1:]:
+            result.append(Inheritance(element))
         return result
 
 
@@ -85,28 +225,172 @@ class Inheritors(object):
 
         @return: list of UMLElements.
         """
-        result = list()
-        for node in self.context._index.values():
-            if IGeneralization.providedBy(node) \
-               and node.general is self.context:
-                result.append(node.specific)
-        return result
+        index = self.context.modelindex('generalizations')
+        return [node.specific for node in index.get(self.context.uuid)]
 
     @property
     def all(self):
         """UMLElements which are inheriting (less general) from the
         given UMLElement, following the tree down: childs of childs are
-        included.
+        included. Each element is contained once, also on diamond shaped or
+        cyclic hierarchies.
 
         @return: list of UMLElements.
         """
-        result = self.direct
-        for node in self.direct:
-            if node is self.context:
+        index = self.context.modelindex('generalizations')
+        result = [self.context]
+        seen = set([self.context.uuid])
+        position = 0
+        while position < len(result):
+            for generalization in index.get(result[position].uuid):
+                node = generalization.specific
+                if node.uuid not in seen:
+                    seen.add(node.uuid)
+                    result.append(node)
+            position += 1
+        return result[1:]
+
+
+class StereotypeApplications(object):
+    """Elements of a model having a stereotype applied, looked up in a model
+    wide index by profile and stereotype name.
+    """
+
+    def __init__(self, context):
+        """@param context: some UMLElement of the model to query."""
+        self.context = context
+
+    def _key(self, profile, name):
+        if profile is not None and not isinstance(profile, UUID):
+            profile = profile.uuid
+        return profile, name
+
+    def elements(self, profile, name):
+        """Iterate over the elements having stereotype name of profile
+        applied, in the order the stereotypes were applied. The model must
+        not be changed while iterating.
+
+        @param profile: Profile or uuid of the profile, None for stereotypes
+        without profile.
+
+        @param name: name of the stereotype.
+        """
+        index = self.context.modelindex('stereotypeapplications')
+        for stereotype in index.iter(self._key(profile, name)):
+            yield stereotype.__parent__
+
+    def count(self, profile, name):
+        """Number of elements having stereotype name of profile applied.
+        """
+        index = self.context.modelindex('stereotypeapplications')
+        return index.count(self._key(profile, name))
+
+
+class GeneralizationClosure(object):
+    """Transitive closure of the generalization hierarchy of a whole model.
+
+    Computed in one topological pass over all Generalizations. Elements get
+    integer ids, ancestors and descendants of each element are held as
+    bitsets. The closure is a snapshot, create a new one after changing
+    Generalizations.
+    """
+
+    def __init__(self, model):
+        """@param model: UMLElement to compute the closure for, usually the
+        Model. Generalizations below it are taken into account.
+
+        @raise ModelIllFormedException: on generalization cycles.
+        """
+        self._ids = dict()
+        self._elements = list()
+        generals = list()
+        specifics = list()
+
+        def elementid(element):
+            id = self._ids.get(element.uuid)
+            if id is None:
+                id = self._ids[element.uuid] = len(self._elements)
+                self._elements.append(element)
+                generals.append(set())
+                specifics.append(list())
+            return id
+
+        for node in walk(model):
+            if not provides(node, IGeneralization):
+                continue
+            general = node.general
+            if general is None or node.specific is None:
                 continue
-            result += Inheritors(node).all
+            sid = elementid(node.specific)
+            gid = elementid(general)
+            if gid not in generals[sid]:
+                generals[sid].add(gid)
+                specifics[gid].append(sid)
+        count = len(self._elements)
+        pending = [len(ids) for ids in generals]
+        order = [id for id in range(count) if not pending[id]]
+        self._ancestors = [0] * count
+        position = 0
+        while position < len(order):
+            gid = order[position]
+            position += 1
+            bits = self._ancestors[gid] | (1 << gid)
+            for sid in specifics[gid]:
+                self._ancestors[sid] |= bits
+                pending[sid] -= 1
+                if not pending[sid]:
+                    order.append(sid)
+        if len(order) < count:
+            names = sorted([str(self._elements[id].name)
+                            for id in range(count) if pending[id]])
+            raise ModelIllFormedException, \
+                  u"Generalization cycle, affected elements: %s" % \
+                  ', '.join(names)
+        self._descendants = [0] * count
+        for sid in reversed(order):
+            bits = self._descendants[sid] | (1 << sid)
+            for gid in generals[sid]:
+                self._descendants[gid] |= bits
+
+    def _expand(self, bits):
+        result = list()
+        while bits:
+            low = bits & -bits
+            result.append(self._elements[low.bit_length() - 1])
+            bits ^= low
         return result
 
+    def ancestors(self, element):
+        """All more general elements of element.
+
+        @return: list of UMLElements.
+        """
+        id = self._ids.get(element.uuid)
+        if id is None:
+            return list()
+        return self._expand(self._ancestors[id])
+
+    def descendants(self, element):
+        """All less general elements of element.
+
+        @return: list of UMLElements.
+        """
+        id = self._ids.get(element.uuid)
+        if id is None:
+            return list()
+        return self._expand(self._descendants[id])
+
+    def is_subtype(self, specific, general):
+        """Check whether specific is general or inherits from it.
+        """
+        if specific is general:
+            return True
+        sid = self._ids.get(specific.uuid)
+        gid = self._ids.get(general.uuid)
+        if sid is None or gid is None:
+            return False
+        return bool(self._ancestors[sid] >> gid & 1)
+
 
 class Associations(object):
     """Adapter to get information about an UMLElements associations.
@@ -116,14 +400,15 @@ class Associations(object):
         self.context = context
 
     def _match_end(self, end):
-        return IAssociationEnd.providedBy(end)
+        return provides(end, IAssociationEnd)
 
     def _find_associations_ends(self, partipants):
-        partuuids = [p.uuid for p in partipants]
+        index = self.context.modelindex('associationends')
         result = list()
-        for node in self.context._index.values():
-            if self._match_end(node) and node.type.uuid in partuuids:
-                result.append(node)
+        for participant in partipants:
+            for node in index.get(participant.uuid):
+                if self._match_end(node):
+                    result.append(node)
         return result
 
     @property
@@ -142,10 +427,7 @@ class Associations(object):
 
         @return: list of AssociationEnd instances.
         """
-        inheritance = Inheritance(self.context)
-        subs = [el.context for el in inheritance.all
-                if el.context is not self.context]
-        return self._find_associations_ends(subs)
+        return self._find_associations_ends(Inheritance(self.context).mro[1:])
 
     @property
     def directlyrealized(self):
@@ -157,12 +439,13 @@ class Associations(object):
         @return: list of AssociationEnd instances.
         """
         participatinginterfaces = list()
+        participatinguuids = set()
         for directrealization in \
             self.context.filtereditervalues(IInterfaceRealization):
-            participatinguuids = [i.uuid for i in participatinginterfaces]
-            for inheritance in Inheritance(directrealization.contract).all:
-                if inheritance.context.uuid not in participatinguuids:
-                    participatinginterfaces.append(inheritance.context)
+            for interface in Inheritance(directrealization.contract).mro:
+                if interface.uuid not in participatinguuids:
+                    participatinguuids.add(interface.uuid)
+                    participatinginterfaces.append(interface)
         return self._find_associations_ends(participatinginterfaces)
 
     @property
@@ -176,11 +459,12 @@ class Associations(object):
         @return: list of AssociationEnd instances.
         """
         ends = list()
-        inherited = [el.context for el in Inheritance(self.context).all]
-        for node in inherited:
+        seen = set()
+        for node in Inheritance(self.context).mro:
             associations = self.__class__(node)
             for end in associations.directlyrealized:
-                if end.uuid not in [e.uuid for e in ends]:
+                if end.uuid not in seen:
+                    seen.add(end.uuid)
                     ends.append(end)
         return ends
 
@@ -193,10 +477,12 @@ class Associations(object):
           list of AssociationEnd instances.
         """
         result = self.direct
+        seen = set([r.uuid for r in result])
         for end in self.directlyrealized + \
                    self.inherited + \
                    self.inheritedrealized:
-            if end.uuid not in [r.uuid for r in result]:
+            if end.uuid not in seen:
+                seen.add(end.uuid)
                 result.append(end)
         return result
 
@@ -241,23 +527,107 @@ class Aggregators(Associations):
            list of UMLElements
         """
         results = list()
+        seen = set()
         for end in self.all:
             results.append(end.type)
+            seen.add(end.type.uuid)
             for inheritor in Inheritors(end.type).all:
-                if inheritor.uuid not in [r.uuid for r in results]:
+                if inheritor.uuid not in seen:
+                    seen.add(inheritor.uuid)
                     results.append(inheritor)
         return results
 
 
 UNSET = object()
+_MISSING = object()
+
+
+class TaggedValuesCache(object):
+    """Model wide LRU cache for ``TaggedValues`` queries.
+
+    Changing a Stereotype, TaggedValue or Generalization anywhere in the model
+    clears the cache, changing other elements drops their entries.
+    """
+    maxsize = 10000
+
+    def __init__(self):
+        self.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        # odict counts its keys by iterating
+        return self._size
+
+    def lookup(self, key, default=None):
+        if key not in self._entries:
+            self.misses += 1
+            return default
+        self.hits += 1
+        value = self._entries.pop(key)
+        self._entries[key] = value
+        return value
+
+    def store(self, key, value):
+        if key not in self._entries:
+            self._size += 1
+            self._keys.setdefault(key[0], set()).add(key)
+        self._entries[key] = value
+        while self._size > self.maxsize:
+            oldest = self._entries.firstkey()
+            del self._entries[oldest]
+            self._keys[oldest[0]].discard(oldest)
+            self._size -= 1
+
+    def clear(self):
+        self._entries = odict()
+        self._keys = dict()
+        self._size = 0
+
+    def invalidate(self, node):
+        if provides(node, IStereotype) \
+          or provides(node, ITaggedValue) \
+          or provides(node, IGeneralization):
+            if self._size:
+                self.clear()
+            return
+        for key in self._keys.pop(node.uuid, ()):
+            del self._entries[key]
+            self._size -= 1
+
+
+register_cache('taggedvalues', IUMLElement, TaggedValuesCache)
 
 
 class TaggedValues(object):
     """Adapter to get information about an UMLElements TaggedValues.
     """
 
-    def __init__(self, context):
+    def __init__(self, context, cached=False):
+        """@param context: some UMLElement to get information from.
+
+        @param cached: if given, results of ``inherited`` and ``namespaced``
+        are cached model wide, see ``TaggedValuesCache``.
+        """
         self.context = context
+        self.cached = cached
+
+    def _cachedquery(self, kind, tag, stereotype, alternatives, aggregate):
+        cache = self.context.modelcache('taggedvalues')
+        key = (self.context.uuid, kind, tag, stereotype,
+               tuple([isinstance(a, basestring) and a or tuple(a)
+                      for a in alternatives]),
+               aggregate)
+        value = cache.lookup(key, _MISSING)
+        if value is _MISSING:
+            query = getattr(self, '_%s' % kind)
+            value = query(tag, stereotype, alternatives, aggregate)
+            if aggregate:
+                value = tuple(value)
+            cache.store(key, value)
+        if aggregate:
+            return list(value)
+        return value
 
     def direct(self, tag, stereotype=None, default=UNSET):
         """Access only tgvs directly applied through stereotypes on element.
@@ -297,12 +667,15 @@ class TaggedValues(object):
         return normalized
 
     def _direct_with_alternatives(self, tag, stereotype, alternatives):
+        return self._direct_pairs(
+            self._normalized_tgv_pairs(tag, stereotype, alternatives))
+
+    def _direct_pairs(self, pairs):
         result = list()
-        for ltag, lstereotype in self._normalized_tgv_pairs(tag, stereotype,
-                                                  alternatives):
+        for ltag, lstereotype in pairs:
             value = self.direct(ltag, lstereotype)
             if value is not UNSET:
-                result.append(self.direct(ltag, lstereotype))
+                result.append(value)
         return result
 
     def inherited(self, tag, stereotype=None, alternatives=[], aggregate=True):
@@ -329,11 +702,17 @@ class TaggedValues(object):
         ``return``
           A value, or in case of ``aggregate`` a list of values.
         """
+        if self.cached:
+            return self._cachedquery('inherited', tag, stereotype,
+                                     alternatives, aggregate)
+        return self._inherited(tag, stereotype, alternatives, aggregate)
+
+    def _inherited(self, tag, stereotype, alternatives, aggregate):
         result = self._direct_with_alternatives(tag, stereotype, alternatives)
         if not aggregate and result:
             return result[0]
         for generalization in self.context.filtereditervalues(IGeneralization):
-            tgv = TaggedValues(generalization.general)
+            tgv = TaggedValues(generalization.general, self.cached)
             subres = tgv.inherited(tag, stereotype, alternatives, aggregate)
             if aggregate:
                 result += subres
@@ -366,6 +745,12 @@ class TaggedValues(object):
         ``return``
           A value, or in case of ``aggregate`` a list of values.
         """
+        if self.cached:
+            return self._cachedquery('namespaced', tag, stereotype,
+                                     alternatives, aggregate)
+        return self._namespaced(tag, stereotype, alternatives, aggregate)
+
+    def _namespaced(self, tag, stereotype, alternatives, aggregate):
         result = self._direct_with_alternatives(tag, stereotype, alternatives)
         if not aggregate and result:
             return result[0]
@@ -373,7 +758,344 @@ class TaggedValues(object):
             if not aggregate:
                return UNSET
             return result
-        tgv = TaggedValues(self.context.__parent__)
+        tgv = TaggedValues(self.context.__parent__, self.cached)
         if not aggregate:
             return tgv.namespaced(tag, stereotype, alternatives, aggregate)
         return result + tgv.namespaced(tag, stereotype, alternatives, aggregate)
+
+
+class ModelTaggedValues(object):
+    """Resolve tagged values for all elements of a model in one pass.
+
+    Gives the same results as calling ``TaggedValues(element).inherited`` or
+    ``TaggedValues(element).namespaced`` for each element, but reuses the
+    result of more general elements respective of the parent element.
+    """
+
+    def __init__(self, model, interface=IUMLElement):
+        """@param model: UMLElement to resolve tagged values below, usually
+        the Model.
+
+        @param interface: only elements providing interface are contained in
+        results.
+        """
+        self.model = model
+        self.interface = interface
+
+    def _scan(self, pairs):
+        """Walk the model once, remembering the stereotypes of interest.
+
+        ``return``
+          list of all nodes in the model and a function returning the direct
+          values of a node.
+        """
+        names = set([lstereotype for ltag, lstereotype in pairs])
+        nodes = list()
+        applied = dict()
+        for node in walk(self.model):
+            nodes.append(node)
+            if provides(node, IStereotype) and node.__name__ in names:
+                applied[(id(node.__parent__), node.__name__)] = node
+        walked = set([id(node) for node in nodes])
+
+        def own(node):
+            if id(node) not in walked:
+                # more general element outside of the model
+                return TaggedValues(node)._direct_pairs(pairs)
+            result = list()
+            for ltag, lstereotype in pairs:
+                stereotype = applied.get((id(node), lstereotype))
+                if stereotype is None:
+                    continue
+                taggedvalue = stereotype.taggedvalue(ltag)
+                if taggedvalue is not None:
+                    result.append(taggedvalue.value)
+            return result
+        return nodes, own
+
+    def inherited(self, tag, stereotype=None, alternatives=[], aggregate=True):
+        """Same arguments as ``TaggedValues.inherited``.
+
+        ``return``
+          dict mapping element uuids to value, or in case of ``aggregate`` a
+          list of values.
+        """
+        pairs = TaggedValues(self.model)._normalized_tgv_pairs(
+            tag, stereotype, alternatives)
+        nodes, own = self._scan(pairs)
+        elements = [node for node in nodes if provides(node, self.interface)]
+        values = dict()
+        for element in elements:
+            if element.uuid in values:
+                continue
+            # iterative post order walk, generalization cycles are cut
+            visiting = set()
+            stack = [element]
+            while stack:
+                current = stack[-1]
+                if current.uuid in values:
+                    stack.pop()
+                    continue
+                visiting.add(current.uuid)
+                generals = list()
+                pending = False
+                for generalization in \
+                        current.filtereditervalues(IGeneralization):
+                    general = generalization.general
+                    if general is None:
+                        continue
+                    if general.uuid not in values:
+                        if general.uuid in visiting:
+                            continue
+                        stack.append(general)
+                        pending = True
+                    generals.append(general)
+                if pending:
+                    continue
+                stack.pop()
+                visiting.discard(current.uuid)
+                direct = own(current)
+                if aggregate:
+                    for general in generals:
+                        direct += values[general.uuid]
+                    values[current.uuid] = direct
+                elif direct:
+                    values[current.uuid] = direct[0]
+                else:
+                    values[current.uuid] = UNSET
+                    for general in generals:
+                        if values[general.uuid] is not UNSET:
+                            values[current.uuid] = values[general.uuid]
+                            break
+        result = dict()
+        for element in elements:
+            result[element.uuid] = values[element.uuid]
+        return result
+
+    def namespaced(self, tag, stereotype=None, alternatives=[],
+                   aggregate=True):
+        """Same arguments as ``TaggedValues.namespaced``.
+
+        ``return``
+          dict mapping element uuids to value, or in case of ``aggregate`` a
+          list of values.
+        """
+        pairs = TaggedValues(self.model)._normalized_tgv_pairs(
+            tag, stereotype, alternatives)
+        nodes, own = self._scan(pairs)
+        parent = self.model.__parent__
+        if parent is not None:
+            outer = TaggedValues(parent).namespaced(
+                tag, stereotype, alternatives, aggregate)
+        elif aggregate:
+            outer = list()
+        else:
+            outer = UNSET
+        # keyed by id, nodes in between may not be referenceable
+        values = dict()
+        result = dict()
+        # walk is depth first, parents are resolved before their children
+        for node in nodes:
+            if node is self.model:
+                inner = outer
+            else:
+                inner = values[id(node.__parent__)]
+            direct = own(node)
+            if aggregate:
+                value = direct + inner
+            elif direct:
+                value = direct[0]
+            else:
+                value = inner
+            values[id(node)] = value
+            if provides(node, self.interface):
+                result[node.uuid] = value
+        return result
+
+
+def _taggedvaluekeys(taggedvalue):
+    stereotype = taggedvalue.__parent__
+    if not provides(stereotype, IStereotype) or stereotype.__parent__ is None:
+        return []
+    value = taggedvalue.value
+    try:
+        hash(value)
+    except TypeError:
+        return []
+    return [(stereotype.__name__, taggedvalue.__name__, value)]
+
+
+class TaggedValueIndex(ReverseIndex):
+    """Maps ``(stereotype, tag, value)`` to the tagged values, and keeps the
+    distinct string values of each stereotype and tag sorted for prefix
+    lookups.
+
+    Unhashable values, like lists, are not indexed.
+    """
+
+    def __init__(self, interface, keys):
+        super(TaggedValueIndex, self).__init__(interface, keys)
+        self._sorted = dict()
+
+    def add(self, node):
+        super(TaggedValueIndex, self).add(node)
+        for key in self._registered.get(node.uuid, ()):
+            stereotype, tag, value = key
+            if isinstance(value, basestring) \
+              and dict.__len__(self._entries[key]) == 1:
+                insort(self._sorted.setdefault((stereotype, tag), []), value)
+
+    def remove(self, node):
+        keys = self._registered.get(node.uuid, ())
+        super(TaggedValueIndex, self).remove(node)
+        for key in keys:
+            stereotype, tag, value = key
+            if isinstance(value, basestring) and key not in self._entries:
+                values = self._sorted[(stereotype, tag)]
+                del values[bisect_left(values, value)]
+                if not values:
+                    del self._sorted[(stereotype, tag)]
+
+    def prefixed(self, stereotype, tag, prefix):
+        """Iterate over the string values of tag starting with prefix, in
+        sorted order.
+        """
+        values = self._sorted.get((stereotype, tag), ())
+        position = bisect_left(values, prefix)
+        while position < len(values) and values[position].startswith(prefix):
+            yield values[position]
+            position += 1
+
+
+register_index('taggedvaluevalues', ITaggedValue, _taggedvaluekeys,
+               TaggedValueIndex)
+
+
+class TaggedValueLookup(object):
+    """Find the elements of a model by the values of their directly applied
+    tagged values, looked up in a model wide index instead of asking each
+    element.
+    """
+
+    def __init__(self, context, interface=IUMLElement):
+        """@param context: some UMLElement of the model to query.
+
+        @param interface: only elements providing interface are contained in
+        results.
+        """
+        self.context = context
+        self.interface = interface
+
+    def _elements(self, index, keys):
+        result = list()
+        for key in keys:
+            for taggedvalue in index.iter(key):
+                element = taggedvalue.__parent__.__parent__
+                if provides(element, self.interface):
+                    result.append(element)
+        return result
+
+    def equal(self, tag, value, stereotype=None):
+        """Elements whose tag equals value.
+
+        ``tag``
+          The name of the tag. If no ``stereotype`` argument is given it is
+          expected here in the form: ``STEREOTYPE:TAG``.
+
+        ``return``
+          list of elements, in the order the values were set.
+        """
+        if stereotype is None:
+            stereotype, tag = tag.split(':')
+        index = self.context.modelindex('taggedvaluevalues')
+        return self._elements(index, [(stereotype, tag, value)])
+
+    def prefix(self, tag, prefix, stereotype=None):
+        """Elements whose tag is a string starting with prefix. Same ``tag``
+        and ``stereotype`` arguments as ``equal``.
+
+        ``return``
+          list of elements, ordered by value.
+        """
+        if stereotype is None:
+            stereotype, tag = tag.split(':')
+        index = self.context.modelindex('taggedvaluevalues')
+        keys = [(stereotype, tag, value)
+                for value in index.prefixed(stereotype, tag, prefix)]
+        return self._elements(index, keys)
+
+
+class Dependencies(object):
+    """Adapter giving the Dependencies an UMLElement is client or supplier
+    of.
+    """
+
+    def __init__(self, context):
+        """@param context: some UMLElement to get information from."""
+        self.context = context
+
+    @property
+    def incoming(self):
+        """Dependencies having the given UMLElement as supplier.
+
+        @return: list of Dependencies.
+        """
+        index = self.context.modelindex('supplierdependencies')
+        return index.get(self.context.uuid)
+
+    @property
+    def outgoing(self):
+        """Dependencies having the given UMLElement as client.
+
+        @return: list of Dependencies.
+        """
+        index = self.context.modelindex('clientdependencies')
+        return index.get(self.context.uuid)
+
+
+class Impact(object):
+    """Elements of a model affected by changes of other elements.
+
+    An element is affected by a change of an element it depends on as client
+    of a Dependency, inherits from or realizes as interface, and by all
+    changes affecting those elements in turn.
+    """
+
+    def __init__(self, context):
+        """@param context: some UMLElement of the model to query."""
+        self.context = context
+
+    def dependents(self, elements):
+        """Transitively affected elements, computed in one breadth first pass
+        over the model wide indexes. Cycles are cut.
+
+        @param elements: changed UMLElements.
+
+        @return: list of affected UMLElements not contained in elements,
+        nearest ones first.
+        """
+        dependencies = self.context.modelindex('supplierdependencies')
+        generalizations = self.context.modelindex('generalizations')
+        realizations = self.context.modelindex('interfacerealizations')
+        # elements are kept alive by queue, ids do not need hashing uuids
+        seen = set()
+        queue = list()
+        for element in elements:
+            if id(element) not in seen:
+                seen.add(id(element))
+                queue.append(element)
+        changed = len(queue)
+        # the queue grows while iterating over it
+        for element in queue:
+            uuid = element.uuid
+            affected = [dependency.client
+                        for dependency in dependencies.iter(uuid)]
+            affected += [generalization.__parent__
+                         for generalization in generalizations.iter(uuid)]
+            affected += [realization.__parent__
+                         for realization in realizations.iter(uuid)]
+            for node in affected:
+                if node is not None and id(node) not in seen:
+                    seen.add(id(node))
+                    queue.append(node)
+        return queue[changed:]
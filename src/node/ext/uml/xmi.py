@@ -0,0 +1,671 @@
+"""Streaming XMI 2.x import and export.
+
+The document is read with ``iterparse``. Elements are created as soon as
+their start tag is read and XML elements are dropped once they are done, so
+memory is bound by the size of the model, not the one of the document.
+Export writes the document while walking the model.
+"""
+from functools import partial
+from xml.etree import cElementTree as etree
+from xml.sax.saxutils import (
+    escape,
+    quoteattr,
+)
+from node.ext.uml.core import (
+    NODEFAULTMARKER,
+    INFINITE,
+    UMLElement,
+    Model,
+    Package,
+    Profile,
+    Stereotype,
+    TaggedValue,
+    Datatype,
+)
+from node.ext.uml.classes import (
+    Class,
+    Interface,
+    Property,
+    Operation,
+    Parameter,
+    Generalization,
+    InterfaceRealization,
+    Association,
+    AssociationClass,
+    AssociationEnd,
+    Dependency,
+)
+from node.ext.uml.activities import (
+    Activity,
+    OpaqueAction,
+    InitialNode,
+    ActivityFinalNode,
+    FlowFinalNode,
+    DecisionNode,
+    MergeNode,
+    ForkNode,
+    JoinNode,
+    ActivityEdge,
+    Constraint,
+    PreConstraint,
+    PostConstraint,
+)
+
+
+# xmi:type -> element class
+TYPES = {
+    'Package': Package,
+    'Profile': Profile,
+    'Class': Class,
+    'Interface': Interface,
+    'DataType': Datatype,
+    'PrimitiveType': Datatype,
+    'Enumeration': Datatype,
+    'Property': Property,
+    'Operation': Operation,
+    'Parameter': Parameter,
+    'Generalization': Generalization,
+    'InterfaceRealization': InterfaceRealization,
+    'Association': Association,
+    'AssociationClass': AssociationClass,
+    'Dependency': Dependency,
+    'Usage': Dependency,
+    'Abstraction': Dependency,
+    'Realization': Dependency,
+    'Activity': Activity,
+    'OpaqueAction': OpaqueAction,
+    'InitialNode': InitialNode,
+    'ActivityFinalNode': ActivityFinalNode,
+    'FlowFinalNode': FlowFinalNode,
+    'DecisionNode': DecisionNode,
+    'MergeNode': MergeNode,
+    'ForkNode': ForkNode,
+    'JoinNode': JoinNode,
+    'ControlFlow': ActivityEdge,
+    'ObjectFlow': ActivityEdge,
+    'Constraint': Constraint,
+}
+
+# xmi:type of tags it may be omitted for
+TAGTYPES = {
+    'generalization': 'Generalization',
+    'interfaceRealization': 'InterfaceRealization',
+    'ownedAttribute': 'Property',
+    'ownedEnd': 'Property',
+    'ownedOperation': 'Operation',
+    'ownedParameter': 'Parameter',
+    'ownedRule': 'Constraint',
+}
+
+# XMI attribute -> reference of element class
+REFERENCES = {
+    Generalization: ('general',),
+    InterfaceRealization: ('contract',),
+    Property: ('type',),
+    Parameter: ('type',),
+    AssociationEnd: ('type', 'association'),
+    Dependency: ('client', 'supplier'),
+    ActivityEdge: ('source', 'target'),
+}
+
+# tags of value specifications -> attribute of owning element
+VALUES = {
+    'defaultValue': 'default',
+    'lowerValue': 'lowervalue',
+    'upperValue': 'uppervalue',
+    'guard': 'guard',
+    'specification': 'specification',
+}
+
+# xmi:type of literal value specifications -> conversion of their value
+LITERALS = {
+    'LiteralInteger': lambda value: int(value or 0),
+    'LiteralUnlimitedNatural':
+        lambda value: value == '*' and INFINITE or int(value or 0),
+    'LiteralBoolean': lambda value: value == 'true',
+    'LiteralNull': lambda value: None,
+}
+
+XMINS = 'http://schema.omg.org/spec/XMI/2.1'
+UMLNS = 'http://www.eclipse.org/uml2/3.0.0/UML'
+PROFILENS = 'http:///schemas/%s/1'
+NOPROFILENS = 'http:///schemas/noprofile'
+
+_DOCUMENT = object()
+_SKIP = object()
+_VALUE = object()
+
+
+class _Application(object):
+    """Stereotype application read so far.
+    """
+
+    def __init__(self, stereotype, base, profile):
+        self.stereotype = stereotype
+        self.base = base
+        self.profile = profile
+        self.tags = list()
+
+
+def _split(tag):
+    """Split ``{namespace}name`` into namespace and name.
+    """
+    if tag[0] == '{':
+        namespace, name = tag[1:].split('}', 1)
+        return namespace, name
+    return None, tag
+
+
+class XMIImporter(object):
+    """Read an XMI 2.x document into a ``Model``.
+
+    References to elements not read yet are kept in a pending table and set
+    once the referenced element shows up. References are read from
+    attributes, i.e. ``general="id"``, or from child elements, i.e.
+    ``<general xmi:idref="id"/>``. Stereotype applications create a
+    ``Stereotype`` named like the stereotype on the base element, its tags
+    become ``TaggedValue`` children. Its profile is looked up by the XML
+    namespace prefix and created in the model if missing, stereotypes in
+    namespace ``NOPROFILENS`` get no profile.
+    """
+
+    def __init__(self):
+        self.model = None
+        self.count = 0
+        self._namespaces = dict()
+        self._xmins = list()
+        self._ids = dict()
+        self._pending = dict()
+        self._memberends = dict()
+        self._profiles = dict()
+
+    @property
+    def unresolved(self):
+        """xmiids referenced but not contained in the document.
+        """
+        return sorted(self._pending.keys())
+
+    def parse(self, source):
+        """Read source, a file name or file object, and return the model.
+        """
+        stack = list()
+        for event, item in etree.iterparse(
+                source, events=('start-ns', 'start', 'end')):
+            if event == 'start':
+                stack.append((item, self._start(item, stack)))
+            elif event == 'end':
+                elem, obj = stack.pop()
+                self._end(elem, obj, stack)
+            else:
+                prefix, uri = item
+                self._namespaces.setdefault(uri, prefix)
+                if (prefix == 'xmi' or '/XMI' in uri) \
+                  and uri not in self._xmins:
+                    self._xmins.append(uri)
+        for association, ids in self._memberends.values():
+            ends = [self._ids.get(i) for i in ids]
+            association.memberEnds = [end for end in ends if end is not None]
+        return self.model
+
+    def _xmi(self, elem, name):
+        for namespace in self._xmins:
+            value = elem.get('{%s}%s' % (namespace, name))
+            if value is not None:
+                return value
+        return None
+
+    def _isxmi(self, namespace):
+        return namespace in self._xmins
+
+    def _isuml(self, namespace):
+        return self._namespaces.get(namespace) == 'uml' \
+            or '/UML' in namespace
+
+    def _start(self, elem, stack):
+        namespace, tag = _split(elem.tag)
+        if not stack:
+            if tag == 'XMI':
+                return _DOCUMENT
+            return self._startmodel(elem)
+        owner = stack[-1][1]
+        if owner is _SKIP or owner is _VALUE:
+            return _SKIP
+        if owner is _DOCUMENT:
+            if self.model is None and namespace and self._isuml(namespace) \
+              and tag in ('Model', 'Package'):
+                return self._startmodel(elem)
+            if namespace and not self._isxmi(namespace) \
+              and not self._isuml(namespace):
+                return self._startstereotype(elem, namespace, tag)
+            return _SKIP
+        if isinstance(owner, _Application):
+            # multi valued tag, read when the application ends
+            return _SKIP
+        if tag in VALUES:
+            return _VALUE
+        if tag in REFERENCES.get(owner.__class__, ()) or (
+                tag == 'memberEnd' and isinstance(owner, Association)):
+            # reference given as child element
+            xmiid = self._xmi(elem, 'idref')
+            if xmiid is None:
+                pass
+            elif tag == 'memberEnd':
+                self._memberend(owner, [xmiid])
+            else:
+                self._reference(owner, tag, xmiid)
+            return _SKIP
+        if isinstance(owner, Profile):
+            # stereotype definitions
+            return _SKIP
+        return self._startelement(elem, owner, stack[-1][0], tag)
+
+    def _startmodel(self, elem):
+        self.model = Model(elem.get('name'))
+        self.model._xmiid = self._xmi(elem, 'id')
+        self._register(self.model)
+        return self.model
+
+    def _startelement(self, elem, owner, ownerelem, tag):
+        xmitype = self._xmi(elem, 'type')
+        if xmitype is not None:
+            xmitype = xmitype.split(':')[-1]
+        else:
+            xmitype = TAGTYPES.get(tag)
+        factory = TYPES.get(xmitype)
+        if factory is None:
+            return _SKIP
+        xmiid = self._xmi(elem, 'id')
+        if factory is Property and (tag == 'ownedEnd'
+                                    or elem.get('association')):
+            factory = AssociationEnd
+        elif factory is Constraint and xmiid is not None:
+            if xmiid in ownerelem.get('precondition', '').split():
+                factory = PreConstraint
+            elif xmiid in ownerelem.get('postcondition', '').split():
+                factory = PostConstraint
+        element = factory()
+        name = elem.get('name')
+        element.xminame = name
+        if factory is Class:
+            element.isAbstract = elem.get('isAbstract') == 'true'
+        elif factory is Parameter:
+            element.direction = elem.get('direction', 'in')
+        elif factory is AssociationEnd:
+            aggregation = elem.get('aggregation')
+            if aggregation in AssociationEnd.AGGREGATIONS:
+                element.aggregationkind = aggregation
+            element.navigable = tag == 'ownedAttribute' \
+                or elem.get('isNavigable') == 'true'
+        for attribute in REFERENCES.get(factory, ()):
+            ids = elem.get(attribute)
+            if ids:
+                # only one client/supplier supported
+                self._reference(element, attribute, ids.split()[0])
+        if isinstance(element, Association) and elem.get('memberEnd'):
+            self._memberend(element, elem.get('memberEnd').split())
+        key = name or xmiid
+        if not key or key in owner:
+            key = xmiid
+        if not key or key in owner:
+            key = '%s-%s' % (xmitype, self.count)
+        element._xmiid = xmiid
+        # children are added after their parent, so each element is added
+        # without children. ``bulk_add`` skips the checks of ``__setitem__``
+        # not needed for new UML elements.
+        owner.bulk_add(((key, element),))
+        self._register(element)
+        if factory is Profile:
+            self._profiles.setdefault(name, element)
+        return element
+
+    def _register(self, element):
+        self.count += 1
+        xmiid = element.xmiid
+        if xmiid is None:
+            return
+        self._ids[xmiid] = element
+        for callback in self._pending.pop(xmiid, ()):
+            callback(element)
+
+    def _reference(self, element, attribute, xmiid):
+        self._resolve(xmiid, partial(setattr, element, attribute))
+
+    def _memberend(self, association, ids):
+        # set when the document is read
+        self._memberends.setdefault(
+            association.uuid, (association, list()))[1].extend(ids)
+
+    def _resolve(self, xmiid, callback):
+        target = self._ids.get(xmiid)
+        if target is not None:
+            callback(target)
+        else:
+            self._pending.setdefault(xmiid, list()).append(callback)
+
+    def _startstereotype(self, elem, namespace, tag):
+        base = None
+        tags = list()
+        for key, value in elem.attrib.iteritems():
+            if key.startswith('base_'):
+                base = value
+            elif key[0] != '{':
+                tags.append((key, value))
+        if base is None:
+            return _SKIP
+        stereotype = Stereotype()
+        stereotype.xminame = tag
+        stereotype._xmiid = self._xmi(elem, 'id')
+        profile = None
+        if namespace != NOPROFILENS:
+            profile = self._namespaces.get(namespace, namespace)
+        application = _Application(stereotype, base, profile)
+        application.tags = tags
+        return application
+
+    def _end(self, elem, obj, stack):
+        if obj is _VALUE:
+            value = elem.get('value')
+            convert = LITERALS.get((self._xmi(elem, 'type') or '')
+                                   .split(':')[-1])
+            if convert is not None:
+                try:
+                    value = convert(value)
+                except ValueError:
+                    pass
+            elif value is None:
+                for sub in elem:
+                    if _split(sub.tag)[1] == 'body':
+                        value = sub.text
+                        break
+            setattr(stack[-1][1], VALUES[_split(elem.tag)[1]], value)
+        elif isinstance(obj, _Application):
+            self._endstereotype(elem, obj)
+        if not stack:
+            return
+        owner = stack[-1][1]
+        if owner is _DOCUMENT or isinstance(owner, UMLElement):
+            # done, drop it
+            elem.clear()
+            del stack[-1][0][-1]
+
+    def _endstereotype(self, elem, application):
+        values = dict(application.tags)
+        for sub in elem:
+            tag = _split(sub.tag)[1]
+            value = sub.text
+            if value is None:
+                value = sub.get('href') or self._xmi(sub, 'idref')
+            if tag not in values:
+                application.tags.append((tag, value))
+                values[tag] = value
+                continue
+            # multi valued
+            current = values[tag]
+            if not isinstance(current, list):
+                current = values[tag] = [current]
+            current.append(value)
+        application.tags = [(key, values[key]) for key, _ in application.tags]
+        if application.profile is not None:
+            application.stereotype.profile = self._profile(
+                application.profile)
+        self.count += 1
+        self._resolve(application.base, partial(self._apply, application))
+
+    def _apply(self, application, base):
+        stereotype = application.stereotype
+        key = stereotype.xminame
+        if key in base:
+            key = '%s-%s' % (key, self.count)
+        base[key] = stereotype
+        for tag, value in application.tags:
+            stereotype[tag] = TaggedValue()
+            stereotype[tag].value = value
+
+    def _profile(self, name):
+        profile = self._profiles.get(name)
+        if profile is None:
+            for profile in self.model.profiles:
+                if profile.name == name:
+                    break
+            else:
+                self.model[name] = profile = Profile()
+            self._profiles[name] = profile
+        return profile
+
+
+def load(source):
+    """Read XMI from source, a file name or file object, and return the
+    model.
+    """
+    return XMIImporter().parse(source)
+
+
+# element class -> xmi:type
+XMITYPES = {
+    Model: 'Model',
+    Datatype: 'DataType',
+    Dependency: 'Dependency',
+    ActivityEdge: 'ControlFlow',
+    Constraint: 'Constraint',
+    PreConstraint: 'Constraint',
+    PostConstraint: 'Constraint',
+}
+for _name, _factory in TYPES.items():
+    XMITYPES.setdefault(_factory, _name)
+XMITYPES[AssociationEnd] = 'Property'
+
+# element class -> tag, if not packagedElement
+TAGS = {
+    Generalization: 'generalization',
+    InterfaceRealization: 'interfaceRealization',
+    Property: 'ownedAttribute',
+    AssociationEnd: 'ownedAttribute',
+    Operation: 'ownedOperation',
+    Parameter: 'ownedParameter',
+    Constraint: 'ownedRule',
+    PreConstraint: 'ownedRule',
+    PostConstraint: 'ownedRule',
+    ActivityEdge: 'edge',
+    OpaqueAction: 'node',
+    InitialNode: 'node',
+    ActivityFinalNode: 'node',
+    FlowFinalNode: 'node',
+    DecisionNode: 'node',
+    MergeNode: 'node',
+    ForkNode: 'node',
+    JoinNode: 'node',
+}
+
+
+_KNOWN = dict()
+
+
+def _known(cls):
+    """Return cls or its nearest base class having a xmi:type, None if there
+    is none.
+    """
+    known = _KNOWN.get(cls, _KNOWN)
+    if known is _KNOWN:
+        for known in cls.__mro__:
+            if known in XMITYPES:
+                break
+        else:
+            known = None
+        _KNOWN[cls] = known
+    return known
+
+
+def _encode(value):
+    if not isinstance(value, basestring):
+        value = str(value)
+    if isinstance(value, unicode):
+        value = value.encode('utf-8')
+    return value
+
+
+def _attr(value):
+    return quoteattr(_encode(value))
+
+
+def _literal(tag, value):
+    """Return xmi:type and quoted value of a literal value specification.
+    """
+    if value is INFINITE:
+        return 'LiteralUnlimitedNatural', '"*"'
+    if isinstance(value, bool):
+        return 'LiteralBoolean', value and '"true"' or '"false"'
+    if isinstance(value, (int, long)):
+        if tag == 'upperValue':
+            return 'LiteralUnlimitedNatural', _attr(value)
+        return 'LiteralInteger', _attr(value)
+    return 'LiteralString', _attr(value)
+
+
+class XMIExporter(object):
+    """Write a model as XMI 2.x document to a file object.
+
+    Elements are written while walking the model. References are written as
+    ``xmi:idref`` child elements, using the ``xmiid`` of the referenced
+    element or an id generated from its uuid if it has none. Stereotypes are
+    written as stereotype applications after the model, in a namespace named
+    after their profile.
+
+    Elements are written as the nearest of their classes read by
+    ``XMIImporter``. Elements of other classes are skipped with everything
+    they contain.
+    """
+
+    def __init__(self, out):
+        self.out = out
+        self.count = 0
+        self._applications = list()
+
+    def write(self, model):
+        out = self.out
+        out.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        out.write('<xmi:XMI xmi:version="2.1" xmlns:xmi=%s xmlns:uml=%s>\n'
+                  % (_attr(XMINS), _attr(UMLNS)))
+        self._element(model, 'uml:Model', 1)
+        for stereotype, base in self._applications:
+            self._application(stereotype, base)
+        out.write('</xmi:XMI>\n')
+
+    def _id(self, element):
+        xmiid = element.xmiid
+        if xmiid is None:
+            xmiid = '_%s' % element.uuid
+        return xmiid
+
+    def _element(self, element, tag, depth):
+        cls = _known(element.__class__)
+        self.count += 1
+        indent = '  ' * depth
+        attrs = list()
+        if tag != 'uml:Model':
+            attrs.append(('xmi:type', 'uml:' + XMITYPES[cls]))
+        attrs.append(('xmi:id', self._id(element)))
+        if element.name is not None:
+            attrs.append(('name', element.name))
+        if isinstance(element, Class) and element.isAbstract:
+            attrs.append(('isAbstract', 'true'))
+        elif cls is Parameter:
+            attrs.append(('direction', element.direction))
+        elif cls is AssociationEnd:
+            if element.aggregationkind is not None:
+                attrs.append(('aggregation', element.aggregationkind))
+            if element.navigable:
+                attrs.append(('isNavigable', 'true'))
+            # tells ends from properties when reading the start tag
+            if element.association is not None:
+                attrs.append(('association', self._id(element.association)))
+        for kind, constraint in ((PreConstraint, 'precondition'),
+                                 (PostConstraint, 'postcondition')):
+            ids = [self._id(sub) for sub in element.values()
+                   if _known(sub.__class__) is kind]
+            if ids:
+                attrs.append((constraint, ' '.join(ids)))
+        start = '%s<%s %s' % (indent, tag, ' '.join(
+            ['%s=%s' % (name, _attr(value)) for name, value in attrs]))
+        lines = self._references(element) + self._values(element)
+        children = list()
+        for sub in element.values():
+            if isinstance(sub, Stereotype):
+                self._applications.append((sub, element))
+                continue
+            subcls = _known(sub.__class__)
+            if subcls is not None and subcls is not Model:
+                subtag = TAGS.get(subcls, 'packagedElement')
+                if subcls is AssociationEnd and isinstance(element,
+                                                           Association):
+                    subtag = 'ownedEnd'
+                children.append((sub, subtag))
+        if not lines and not children:
+            self.out.write(start + '/>\n')
+            return
+        self.out.write(start + '>\n')
+        for line in lines:
+            self.out.write('%s  %s\n' % (indent, line))
+        for sub, subtag in children:
+            self._element(sub, subtag, depth + 1)
+        self.out.write('%s</%s>\n' % (indent, tag))
+
+    def _references(self, element):
+        references = [(attribute, getattr(element, attribute))
+                      for attribute in REFERENCES.get(
+                          _known(element.__class__), ())
+                      if attribute != 'association']
+        if isinstance(element, Association):
+            references += [('memberEnd', end) for end in element.memberEnds]
+        return ['<%s xmi:idref=%s/>' % (attribute, _attr(self._id(target)))
+                for attribute, target in references if target is not None]
+
+    def _values(self, element):
+        lines = list()
+        for tag, attribute in sorted(VALUES.items()):
+            value = getattr(element, attribute, None)
+            if value is None or value is NODEFAULTMARKER:
+                continue
+            if tag == 'specification':
+                lines.append('<%s xmi:type="uml:OpaqueExpression">'
+                             '<body>%s</body></%s>'
+                             % (tag, escape(_encode(value)), tag))
+            else:
+                lines.append('<%s xmi:type="uml:%s" value=%s/>'
+                             % ((tag,) + _literal(tag, value)))
+        return lines
+
+    def _application(self, stereotype, base):
+        profile = stereotype.profile
+        if profile is not None:
+            prefix, namespace = profile.name, PROFILENS % profile.name
+        else:
+            prefix, namespace = 'noprofile', NOPROFILENS
+        attrs = [('xmlns:%s' % prefix, namespace),
+                 ('xmi:id', self._id(stereotype)),
+                 ('base_%s' % XMITYPES[_known(base.__class__)],
+                  self._id(base))]
+        multi = list()
+        for taggedvalue in stereotype.taggedvalues:
+            value = taggedvalue.value
+            if isinstance(value, (list, tuple)):
+                multi.append((taggedvalue.name, value))
+            elif value is not None:
+                attrs.append((taggedvalue.name, value))
+        tag = '%s:%s' % (prefix, stereotype.name)
+        start = '  <%s %s' % (tag, ' '.join(
+            ['%s=%s' % (key, _attr(attr)) for key, attr in attrs]))
+        if not multi:
+            self.out.write(start + '/>\n')
+            return
+        self.out.write(start + '>\n')
+        for name, values in multi:
+            for value in values:
+                self.out.write('    <%s>%s</%s>\n' % (
+                    name, escape(_encode(value)), name))
+        self.out.write('  </%s>\n' % tag)
+
+
+def dump(model, out):
+    """Write model as XMI to out, a file object.
+    """
+    XMIExporter(out).write(model)